@@ -0,0 +1,224 @@
+'''
+Benchmarks for the hot paths of prisoners_dilemma.py:
+
+  rounds       play_round() throughput for each strategy
+  matches      play_iterative_rounds() latency at 100, 1000 and 10000 rounds
+  tournaments  full play_tournament() round robins of 21, 100 and 500 teams
+
+Every scenario is seeded, so two runs do the same work. Results are
+printed and saved as JSON (benchmark.json by default) with rounds per
+second, allocated memory and peak RSS, so runs from different versions
+can be compared. For example:
+
+  python benchmark.py --quick
+  python benchmark.py --scenario matches --output before.json
+'''
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows; peak RSS is left out there
+    resource = None
+
+import prisoners_dilemma as pd
+
+SEED = 2024
+
+def peak_rss_kb():
+    '''Peak resident set size of this process and its finished children
+    in KB, or None where the resource module is missing.'''
+    if resource is None:
+        return None
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss +
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if sys.platform == 'darwin':
+        # macOS reports bytes, Linux KB
+        peak //= 1024
+    return peak
+
+def measure(run, repeat):
+    '''Times run() repeat times and then once more under tracemalloc.
+    run() returns how many rounds it played.'''
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        rounds = run()
+        times.append(time.perf_counter() - start)
+    # allocations are measured on a separate run, since tracing is slow
+    gc.collect()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    run()
+    blocks = sys.getallocatedblocks() - blocks
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times.sort()
+    return {'rounds': rounds,
+            'best_seconds': times[0],
+            'median_seconds': times[len(times) // 2],
+            'rounds_per_second': rounds / times[0] if times[0] else None,
+            'alloc_peak_bytes': peak,
+            'alloc_retained_blocks': blocks,
+            'peak_rss_kb': peak_rss_kb()}
+
+@contextlib.contextmanager
+def field_of(size):
+    '''Makes players 0..size-1 available, registering copies of the built-in
+    strategies under the ids past the last real one, and removes them again
+    afterwards.'''
+    originals = sorted(pd.STRATEGIES)
+    added = []
+    for player in range(size):
+        if player not in pd.STRATEGIES:
+            original = pd.STRATEGIES[originals[player % len(originals)]]
+            pd.STRATEGIES[player] = pd.Strategy(
+                player, original.team_name, original.function,
+                original.machine, memory_one=original.memory_one)
+            added.append(player)
+    try:
+        yield
+    finally:
+        for player in added:
+            del pd.STRATEGIES[player]
+
+def bench_rounds(rounds, repeat):
+    '''play_round() throughput for each strategy against Loyal Vengeful.'''
+    results = {}
+    for player in sorted(pd.STRATEGIES):
+        def run():
+            rng = random.Random(SEED)
+            moves1 = pd.MoveHistory(rounds)
+            moves2 = pd.MoveHistory(rounds)
+            score1 = score2 = 0
+            for round in range(rounds):
+                moves1, moves2, score1, score2 = pd.play_round(
+                    player, 2, moves1, moves2, score1, score2, rng)
+            return rounds
+        result = measure(run, repeat)
+        result['team_name'] = pd.STRATEGIES[player].team_name
+        results[str(player)] = result
+        print('  player %2d: %12.0f rounds/s' % (player, result['rounds_per_second']))
+    return results
+
+# representative pairings: two state machines (solved by cycle detection),
+# a random strategy against a state machine, and the slowest strategy
+MATCH_PAIRINGS = [(2, 9), (5, 2), (15, 13)]
+
+def bench_matches(lengths, repeat):
+    '''play_iterative_rounds() latency for a few pairings and lengths.'''
+    results = {}
+    for player1, player2 in MATCH_PAIRINGS:
+        for rounds in lengths:
+            def run():
+                pd.play_iterative_rounds(
+                    player1, player2, pd.pairing_rng(SEED, player1, player2),
+                    rounds)
+                return rounds
+            result = measure(run, repeat)
+            results['%d-%d/%d' % (player1, player2, rounds)] = result
+            print('  %2d vs %2d, %5d rounds: %9.3f ms' %
+                  (player1, player2, rounds, result['best_seconds'] * 1000))
+    return results
+
+def bench_tournaments(sizes, repeat, workers, engine):
+    '''Whole play_tournament() round robins, report file included.'''
+    results = {}
+    directory = tempfile.mkdtemp()
+    datafile = os.path.join(directory, 'tournament.txt')
+    for size in sizes:
+        with field_of(size):
+            # the seed fixes every pairing's length, so the number of rounds
+            # played can be worked out without playing them; the analytic
+            # engine works some pairings out without playing any rounds,
+            # so those are counted separately
+            exact = total_rounds = 0
+            for player1 in range(size):
+                for player2 in range(player1):
+                    if engine == 'analytic' and \
+                            pd.markov_chain(pd.STRATEGIES[player1]) is not None and \
+                            pd.markov_chain(pd.STRATEGIES[player2]) is not None:
+                        exact += 1
+                    else:
+                        total_rounds += pd.pairing_rng(
+                            SEED, player1, player2).randint(100, 200)
+            def run():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    # no source store, so only playing and reporting is timed
+                    pd.play_tournament(size, workers=workers, seed=SEED,
+                                       engine=engine, datafile=datafile,
+                                       sources=None)
+                return total_rounds
+            result = measure(run, repeat)
+            result['analytic_pairings'] = exact
+            results[str(size)] = result
+            print('  %4d teams: %8.2f s, %12.0f rounds/s' %
+                  (size, result['best_seconds'], result['rounds_per_second']),
+                  end='')
+            print(', %d pairings worked out analytically' % exact if exact else '')
+    os.remove(datafile)
+    os.rmdir(directory)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append',
+                        choices=('rounds', 'matches', 'tournaments'),
+                        help='scenario to run (repeatable; default all)')
+    parser.add_argument('--quick', action='store_true',
+                        help='smaller sizes and fewer repeats, for a quick check')
+    parser.add_argument('--repeat', type=int, default=None,
+                        help='timed runs per measurement (best is reported)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes for the tournaments')
+    parser.add_argument('--engine', default='python',
+                        choices=pd.ENGINES)
+    parser.add_argument('--output', default='benchmark.json',
+                        help='where to write the JSON results')
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenario or ['rounds', 'matches', 'tournaments']
+    repeat = args.repeat or (1 if args.quick else 5)
+    report = {'python': platform.python_version(),
+              'implementation': platform.python_implementation(),
+              'platform': platform.platform(),
+              'cpus': os.cpu_count(),
+              'numpy': pd.np.__version__ if pd.np is not None else None,
+              'seed': SEED,
+              'repeat': repeat,
+              'workers': args.workers,
+              'engine': args.engine,
+              'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'scenarios': {}}
+    if 'rounds' in scenarios:
+        print('play_round throughput:')
+        report['scenarios']['rounds'] = bench_rounds(
+            1000 if args.quick else 10000, repeat)
+    if 'matches' in scenarios:
+        print('play_iterative_rounds latency:')
+        report['scenarios']['matches'] = bench_matches(
+            (100, 1000) if args.quick else (100, 1000, 10000), repeat)
+    if 'tournaments' in scenarios:
+        print('play_tournament round robins:')
+        report['scenarios']['tournaments'] = bench_tournaments(
+            (21,) if args.quick else (21, 100, 500), repeat, args.workers,
+            args.engine)
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    print('results written to', args.output)
+
+if __name__ == '__main__':
+    main()
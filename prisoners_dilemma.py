@@ -9,12 +9,245 @@ to both players.
 
 Pressing the green arrow button will allow you to run the tournament and
 store the output in tournament.txt
+Scripts can run it with options instead, see
+python prisoners_dilemma.py --help
 
 Teams should each code their strategies in their assigned section of code.
+
+Everything runs on the standard library; numpy is only needed for the
+vectorized engine, play_tournament(..., engine='vectorized'), and for the
+evolutionary simulations, play_evolution().
 '''
 
+import array
+import contextlib
+import functools
+import hashlib
+import inspect
+import math
+import os
 import random
-def play_round(player1, player2, history1, history2, score1, score2):
+import struct
+import time
+import zlib
+try:
+    import numpy as np
+except ImportError:
+    # only the vectorized engine and the evolutionary simulations need numpy
+    np = None
+
+RELEASE = 0 # (R) when both players collude
+TREAT = 100 # (T) when you betray your partner
+SEVERE_PUNISHMENT = -500 # (S) when your partner betrays you
+PUNISHMENT = -250 # (P) when both players betray each other
+# Keep T > R > P > S to be a Prisoner's Dilemma
+# Keep 2R > T + S to be an Iterative Prisoner's Dilemma
+
+# each match lasts a random number of rounds between these, see match_lengths()
+MIN_ROUNDS = 100
+MAX_ROUNDS = 200
+
+class Payoffs(object):
+    '''
+    The payoffs of one round: release (R) when both players collude, treat
+    (T) when you betray your partner, severe_punishment (S) when your
+    partner betrays you and punishment (P) when both players betray each
+    other. They are checked once, here, rather than every round.
+    matrix holds them indexed [your move][partner's move], with 0 for
+    collude and 1 for betray.
+    '''
+    __slots__ = ('release', 'treat', 'severe_punishment', 'punishment',
+                 'matrix')
+
+    def __init__(self, release=RELEASE, treat=TREAT,
+                 severe_punishment=SEVERE_PUNISHMENT, punishment=PUNISHMENT):
+        if not treat > release > punishment > severe_punishment:
+            raise ValueError("T > R > P > S is needed for a Prisoner's Dilemma, "
+                             'not T=%r R=%r P=%r S=%r' % (treat, release,
+                                                         punishment,
+                                                         severe_punishment))
+        if not 2 * release > treat + severe_punishment:
+            raise ValueError("2R > T + S is needed for an Iterative Prisoner's "
+                             'Dilemma, not R=%r T=%r S=%r'
+                             % (release, treat, severe_punishment))
+        self.release = release
+        self.treat = treat
+        self.severe_punishment = severe_punishment
+        self.punishment = punishment
+        self.matrix = ((release, severe_punishment), (treat, punishment))
+
+    def score(self, counts):
+        '''
+        The two players' total scores in a match, from how many rounds
+        ended each way: counts is (cc, cb, bc, bb), named by (player1's
+        move, player2's move), like outcome_counts() returns.
+        '''
+        cc, cb, bc, bb = counts
+        return (cc * self.release + cb * self.severe_punishment +
+                bc * self.treat + bb * self.punishment,
+                cc * self.release + cb * self.treat +
+                bc * self.severe_punishment + bb * self.punishment)
+
+    def __eq__(self, other):
+        return isinstance(other, Payoffs) and self.matrix == other.matrix
+
+    def __hash__(self):
+        return hash(self.matrix)
+
+    def __repr__(self):
+        return 'Payoffs(%r, %r, %r, %r)' % (self.release, self.treat,
+                                            self.severe_punishment,
+                                            self.punishment)
+
+DEFAULT_PAYOFFS = Payoffs()
+
+# the default payoffs as a matrix, indexed [your move][partner's move]
+# with 0 for collude and 1 for betray
+PAYOFF_MATRIX = DEFAULT_PAYOFFS.matrix
+
+# the Payoffs that every round is scored with, see scoring()
+_payoffs = DEFAULT_PAYOFFS
+
+@contextlib.contextmanager
+def scoring(payoffs):
+    '''Scores every round played (and every result worked out) with
+    payoffs until the with block ends.'''
+    global _payoffs
+    previous = _payoffs
+    _payoffs = payoffs
+    try:
+        yield payoffs
+    finally:
+        _payoffs = previous
+
+# the (min_rounds, max_rounds) that every match's length is drawn from,
+# see match_lengths()
+_match_lengths = (MIN_ROUNDS, MAX_ROUNDS)
+
+@contextlib.contextmanager
+def match_lengths(min_rounds, max_rounds):
+    '''Draws the length of every match played (or worked out) between
+    min_rounds and max_rounds until the with block ends.'''
+    global _match_lengths
+    if not 1 <= min_rounds <= max_rounds:
+        raise ValueError('need 1 <= min_rounds <= max_rounds, not %r and %r'
+                         % (min_rounds, max_rounds))
+    previous = _match_lengths
+    _match_lengths = (min_rounds, max_rounds)
+    try:
+        yield _match_lengths
+    finally:
+        _match_lengths = previous
+
+# one character per byte value, so reading a move doesn't build a new string
+_MOVE_CHARS = [chr(code) for code in range(256)]
+
+class MoveHistory(object):
+    '''
+    One player's moves within a pairing, one byte per round.
+    The buffer is allocated up front (capacity = expected number of rounds)
+    and moves are appended in place, so a match never copies the history.
+    Strategies are handed history.view, a read-only view of the same buffer.
+    '''
+    __slots__ = ('_buffer', '_length', 'view')
+
+    def __init__(self, capacity=0):
+        self._buffer = bytearray(capacity)
+        self._length = 0
+        self.view = HistoryView(self)
+
+    def append(self, action):
+        '''Records one move. Anything that is not a single character
+        is stored as ' ', the same as a non-string action.'''
+        if len(action) == 1 and action <= '\xff':
+            code = ord(action)
+        else:
+            code = 32
+        if self._length == len(self._buffer):
+            # ran past the expected number of rounds: double the buffer
+            self._buffer.extend(bytes(max(self._length, 16)))
+        self._buffer[self._length] = code
+        self._length += 1
+
+    def __len__(self):
+        return self._length
+
+    def __str__(self):
+        return self._buffer[:self._length].decode('latin-1')
+
+    def __repr__(self):
+        return 'MoveHistory(%r)' % str(self)
+
+class HistoryView(object):
+    '''
+    Read-only, zero-copy view of a MoveHistory that acts like the old
+    history strings: history[-1] is a one-character string, slices are
+    strings, and len(), iteration, 'in' and == compare like a string does.
+    Any other string method (endswith(), find(), ...) and + work on a
+    copy of it as a string; only isinstance(history, str) tells them apart.
+    '''
+    __slots__ = ('_history',)
+
+    def __init__(self, history):
+        self._history = history
+
+    def __len__(self):
+        return self._history._length
+
+    def __getitem__(self, index):
+        history = self._history
+        length = history._length
+        if isinstance(index, slice):
+            start, stop, step = index.indices(length)
+            if step == 1:
+                return history._buffer[start:stop].decode('latin-1')
+            return history._buffer[:length].decode('latin-1')[start:stop:step]
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('history index out of range')
+        return _MOVE_CHARS[history._buffer[index]]
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __contains__(self, item):
+        return item in str(self)
+
+    def count(self, item):
+        return str(self).count(item)
+
+    def __getattr__(self, name):
+        # the rest of the string methods, on a copy (but not private
+        # names, which copy and pickle look for on half-made objects)
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(str(self), name)
+
+    def __add__(self, other):
+        return str(self) + other
+
+    def __radd__(self, other):
+        return other + str(self)
+
+    def __eq__(self, other):
+        if isinstance(other, HistoryView):
+            other = str(other)
+        return str(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __str__(self):
+        return str(self._history)
+
+    def __repr__(self):
+        return repr(str(self))
+
+def play_round(player1, player2, history1, history2, score1, score2, rng=None,
+               noise=None):
     '''
     Calls the get_action() function which will get the characters
     'c' or 'b' for collude or betray for each player.
@@ -22,25 +255,45 @@ def play_round(player1, player2, history1, history2, score1, score2):
     colluded in the first two rounds and betrayed in the most recent round.
     Returns a 4-tuple with updated histories and scores
     (history1, history2, score1, score2)
+
+    The histories can also be MoveHistory objects, in which case the moves
+    are appended to them in place and the same objects are returned.
+    rng is the random number generator handed to the strategies
+    (see pairing_rng()); by default they use the random module.
+    noise is the match's MatchNoise (see Noise.sample()), if it is noisy:
+    the histories returned hold the moves really played, and each player
+    is shown the opponent's moves the way it saw them.
     '''
 
-    RELEASE = 0 # (R) when both players collude
-    TREAT = 100 # (T) when you betray your partner
-    SEVERE_PUNISHMENT = -500 # (S) when your partner betrays you
-    PUNISHMENT = -250 # (P) when both players betray each other
-    # Keep T > R > P > S to be a Prisoner's Dilemma
-    # Keep 2R > T + S to be an Iterative Prisoner's Dilemma
+    in_place = isinstance(history1, MoveHistory)
+    if in_place:
+        # strategies only ever see the read-only views
+        seen1, seen2 = history1.view, history2.view
+    else:
+        seen1, seen2 = history1, history2
+    if noise is not None and noise.seen1 is not None:
+        opponent_seen1, opponent_seen2 = noise.seen1.view, noise.seen2.view
+    else:
+        opponent_seen1, opponent_seen2 = seen1, seen2
 
     #Get the two players' actions and remember them.
-    action1 = get_action(player1, history1, history2, score1, score2)
-    action2 = get_action(player2, history2, history1, score2, score1)
+    action1 = get_action(player1, seen1, opponent_seen2, score1, score2, rng=rng)
+    action2 = get_action(player2, seen2, opponent_seen1, score2, score1, rng=rng)
     if type(action1) != str:
         action1=' '
     if type(action2) != str:
         action2=' '
+    if noise is not None:
+        action1, action2 = noise.play(len(history1), action1, action2)
     #Append the actions to the previous histories, to return
-    new_history1 = history1 + action1
-    new_history2 = history2 + action2
+    if in_place:
+        history1.append(action1)
+        history2.append(action2)
+        new_history1 = history1
+        new_history2 = history2
+    else:
+        new_history1 = history1 + action1
+        new_history2 = history2 + action2
 
     #Change scores based upon player actions
     if action1 not in ('c','b') or action2 not in ('c','b'):
@@ -49,359 +302,1099 @@ def play_round(player1, player2, history1, history2, score1, score2):
         new_score2 = score2
 
     else:
-    #Both players' code provided proper actions
-        if action1 == 'c':
-            if action2 == 'c':
-                # both players collude; get reward
-                new_score1 = score1 + RELEASE
-                new_score2 = score2 + RELEASE
-            else:
-                # players 1,2 collude, betray; get sucker, tempation
-                new_score1 = score1 + SEVERE_PUNISHMENT
-                new_score2 = score2 + TREAT
-        else:
-            if action2 == 'c':
-                # players 1,2 betray, collude; get tempation, sucker
-                new_score1 = score1 + TREAT
-                new_score2 = score2 + SEVERE_PUNISHMENT
-            else:
-                # both players betray; get punishment
-                new_score1 = score1 + PUNISHMENT
-                new_score2 = score2 + PUNISHMENT
+    #Both players' code provided proper actions: look up the payoffs
+        betray1 = action1 == 'b'
+        betray2 = action2 == 'b'
+        payoffs = _payoffs.matrix
+        new_score1 = score1 + payoffs[betray1][betray2]
+        new_score2 = score2 + payoffs[betray2][betray1]
 
     #send back the updated histories and scores
     return (new_history1, new_history2, new_score1, new_score2)
 
-def play_iterative_rounds(player1, player2):
+def pairing_rng(seed, player1, player2, repetition=0):
+    '''
+    Returns the random number generator for one pairing of a tournament.
+    Each (player1, player2, repetition) gets its own random.Random stream
+    derived from the tournament seed, so a pairing plays out the same way
+    no matter which process plays it or in what order.
+    With seed=None this falls back to the shared random module.
+    '''
+    if seed is None:
+        return random
+    return random.Random('%r:%d:%d:%d' % (seed, player1, player2, repetition))
+
+# the opposite of each proper move; noise leaves improper ones alone
+_FLIPPED = {'c': 'b', 'b': 'c'}
+
+def noise_mask(rng, rounds, rate):
+    '''
+    Draws which of a match's rounds some noise hits, each with chance rate,
+    all at once: returns a bytearray with a 1 for every round hit and a 0
+    for the rest. Rather than one draw per round, it draws the gaps between
+    hits (which are geometrically distributed), so only one random number
+    is used per hit.
+    '''
+    mask = bytearray(rounds)
+    if rate <= 0:
+        return mask
+    if rate >= 1:
+        return bytearray(b'\x01') * rounds
+    log_miss = math.log(1 - rate)
+    round = -1
+    while True:
+        round += 1 + int(math.log(1 - rng.random()) / log_miss)
+        if round >= rounds:
+            return mask
+        mask[round] = 1
+
+class Noise(object):
+    '''
+    Noise in a match. mistake_rate is the chance a move comes out the
+    opposite of what the strategy picked (implementation noise), and
+    observation_rate the chance a player sees the opponent's move as the
+    opposite of what it was (observation noise); the scores always count
+    the moves really played. Each match draws its own MatchNoise with
+    sample().
+    '''
+    __slots__ = ('mistake_rate', 'observation_rate')
+
+    def __init__(self, mistake_rate=0.0, observation_rate=0.0):
+        for rate in (mistake_rate, observation_rate):
+            if not 0 <= rate <= 1:
+                raise ValueError('noise rates must be between 0 and 1, not %r'
+                                 % (rate,))
+        self.mistake_rate = mistake_rate
+        self.observation_rate = observation_rate
+
+    def __bool__(self):
+        return bool(self.mistake_rate or self.observation_rate)
+
+    def __eq__(self, other):
+        return (isinstance(other, Noise) and
+                (self.mistake_rate, self.observation_rate) ==
+                (other.mistake_rate, other.observation_rate))
+
+    def __hash__(self):
+        return hash((self.mistake_rate, self.observation_rate))
+
+    def __repr__(self):
+        return 'Noise(%r, %r)' % (self.mistake_rate, self.observation_rate)
+
+    def sample(self, rng, rounds):
+        '''Draws the noise for one match of the given number of rounds.'''
+        return MatchNoise(self, rng, rounds)
+
+class MatchNoise(object):
+    '''
+    The noise of one match, drawn up front by Noise.sample(): which rounds
+    each player makes a mistake in and which of the opponent's moves it
+    misreads. seen1 and seen2 are the histories of player1's and player2's
+    moves as the opponent has seen them (None without observation noise).
+    play_round() takes one of these and calls play() every round.
     '''
-    Plays a random number of rounds (between 100 and 200 rounds)
-    of the iterative prisoners' dilemma between two strategies.
+    __slots__ = ('mistakes1', 'mistakes2', 'misread1', 'misread2',
+                 'seen1', 'seen2')
+
+    def __init__(self, noise, rng, rounds):
+        self.mistakes1 = noise_mask(rng, rounds, noise.mistake_rate)
+        self.mistakes2 = noise_mask(rng, rounds, noise.mistake_rate)
+        if noise.observation_rate:
+            # misread1 is when player2 misreads player1's move
+            self.misread1 = noise_mask(rng, rounds, noise.observation_rate)
+            self.misread2 = noise_mask(rng, rounds, noise.observation_rate)
+            self.seen1 = MoveHistory(rounds)
+            self.seen2 = MoveHistory(rounds)
+        else:
+            self.misread1 = self.misread2 = None
+            self.seen1 = self.seen2 = None
+
+    def play(self, round, action1, action2):
+        '''Turns the moves the strategies picked in the given round into
+        the ones played, and records how the opponents saw them.'''
+        if round < len(self.mistakes1):
+            if self.mistakes1[round]:
+                action1 = _FLIPPED.get(action1, action1)
+            if self.mistakes2[round]:
+                action2 = _FLIPPED.get(action2, action2)
+        if self.seen1 is not None:
+            misread = round < len(self.misread1)
+            self.seen1.append(_FLIPPED.get(action1, action1)
+                              if misread and self.misread1[round] else action1)
+            self.seen2.append(_FLIPPED.get(action2, action2)
+                              if misread and self.misread2[round] else action2)
+        return action1, action2
+
+def play_machines(machine1, machine2, number_of_rounds):
+    '''
+    Plays two StateMachines against each other for number_of_rounds and
+    returns the same 4-tuple as play_iterative_rounds().
+    Two machines always end up going round the same cycle of joint
+    states, so as soon as a (state1, state2) pair comes round again the
+    rest of the match is filled in by repeating that cycle instead of
+    playing it out. A match costs the length of the cycle, not the
+    number of rounds.
+    '''
+    first_seen = {}
+    moves1 = []
+    moves2 = []
+    payoffs = _payoffs.matrix
+    # totals1[i] is player1's score after i rounds
+    totals1 = [0]
+    totals2 = [0]
+    state1 = machine1.start
+    state2 = machine2.start
+    for round in range(number_of_rounds):
+        if (state1, state2) in first_seen:
+            break
+        first_seen[state1, state2] = round
+        action1 = machine1.actions[state1]
+        action2 = machine2.actions[state2]
+        moves1.append(action1)
+        moves2.append(action2)
+        betray1 = action1 == 'b'
+        betray2 = action2 == 'b'
+        totals1.append(totals1[-1] + payoffs[betray1][betray2])
+        totals2.append(totals2[-1] + payoffs[betray2][betray1])
+        state1 = machine1.transitions[state1][betray2]
+        state2 = machine2.transitions[state2][betray1]
+    else:
+        # the match ended before anything repeated
+        return (''.join(moves1), ''.join(moves2), totals1[-1], totals2[-1])
+
+    # rounds cycle_start up to now repeat for the rest of the match
+    played = len(moves1)
+    cycle_start = first_seen[state1, state2]
+    cycle_length = played - cycle_start
+    repeats, extra = divmod(number_of_rounds - played, cycle_length)
+    cycle1 = ''.join(moves1[cycle_start:])
+    cycle2 = ''.join(moves2[cycle_start:])
+    score1 = (totals1[-1] + repeats * (totals1[-1] - totals1[cycle_start]) +
+              totals1[cycle_start + extra] - totals1[cycle_start])
+    score2 = (totals2[-1] + repeats * (totals2[-1] - totals2[cycle_start]) +
+              totals2[cycle_start + extra] - totals2[cycle_start])
+    return (''.join(moves1) + cycle1 * repeats + cycle1[:extra],
+            ''.join(moves2) + cycle2 * repeats + cycle2[:extra],
+            score1, score2)
+
+def play_iterative_rounds(player1, player2, rng=None, number_of_rounds=None,
+                          noise=None, summary=None):
+    '''
+    Plays a random number of rounds (between 100 and 200 rounds, or
+    as set by match_lengths()) of the iterative prisoners' dilemma between two strategies.
     identified in the parameters as integers.
     Returns 4-tuple, for example ('cc', 'bb', -200, 600)
     but with much longer strings
+    The number of rounds and every strategy's random choices are drawn
+    from rng (the random module if not given).
+    If both strategies have state machines the match is worked out
+    by play_machines() instead of being played round by round.
+    Passing number_of_rounds plays exactly that many rounds instead.
+    Passing a Noise makes the match noisy; its noise is drawn from rng
+    for the whole match before the first round. A noisy match is always
+    played round by round.
+    Passing a MatchSummary fills it in with the match's outcome counts.
     '''
-    number_of_rounds = random.randint(100,200)
-    moves1 = ''
-    moves2 = ''
+    if rng is None:
+        rng = random
+    if number_of_rounds is None:
+        number_of_rounds = rng.randint(*_match_lengths)
+    strategy1 = _find_strategy(player1)
+    strategy2 = _find_strategy(player2)
+    if noise:
+        match_noise = noise.sample(rng, number_of_rounds)
+    else:
+        match_noise = None
+        if strategy1 is not None and strategy1.machine is not None and \
+                strategy2 is not None and strategy2.machine is not None:
+            result = play_machines(strategy1.machine, strategy2.machine,
+                                   number_of_rounds)
+            if summary is not None:
+                summary.fill(result[0], result[1])
+            return result
+    # both histories are sized for the whole match and filled in place
+    moves1 = MoveHistory(number_of_rounds)
+    moves2 = MoveHistory(number_of_rounds)
     score1 = 0
     score2 = 0
     for round in range(number_of_rounds):
         moves1, moves2, score1, score2 = \
-            play_round(player1, player2, moves1, moves2, score1, score2)
+            play_round(player1, player2, moves1, moves2, score1, score2, rng,
+                       match_noise)
+    moves1 = str(moves1)
+    moves2 = str(moves2)
+    if summary is not None:
+        summary.fill(moves1, moves2)
     return (moves1, moves2, score1, score2)
 
-def get_action(player, history, opponent_history, score, opponent_score, getting_team_name=False):
+def get_action(player, history, opponent_history, score, opponent_score, getting_team_name=False, rng=None):
     '''Gets the strategy for the player, given their own history and that of
     their opponent, as well as the current scores within this pairing.
     The parameters history and opponent history are strings with one letter
     per round that has been played so far: either an 'c' for collude or a 'b' for
     betray. The function should return one character, 'c' or 'b'.
     The history strings have the first round between these two players
-    as the first character and the most recent round as the last character.'''
-
-    #TEAMS 0-2 ARE EXAMPLE TEAMS
-
-
-    #Team0: Loyal
-    # This example player always colludes
-    #######################################
-
-
-    if player == 0:
-        if getting_team_name:
-            return 'Loyal'
-        else:
-            return 'c'
-
-
-
-    #Team1: Backstabber
-    # This example player always betrays
-    #######################################
-
-
-    elif player == 1:
-        if getting_team_name:
-            return 'Backstabber'
-        else:
-            return 'b'
-
-
-
-    #Team2: Loyal Vengeful
-    #This example player is silent at first and then only betrays if they were a sucker last round.
-    #######################################
-
-
-    elif player == 2:
-        if getting_team_name:
-            return 'Loyal Vengeful'
-        else:
-            if len(opponent_history)==0: #It's the first round: collude
-                return 'c'
-            elif history[-1]=='c' and opponent_history[-1]=='b':
-                return 'b' # betray if they were severely punished last time
-            else:
-                return 'c' #otherwise collude
-
-
-    # EACH STUDENT TEAM CAN CHANGE ONE OF THESE elif SEGMENTS OF CODE BELOW
-    #######################################################################
-
-
-
-
-
-    #Team3: Enter Team Name Here I don't know how for loops work
-    #Team Members: Kai
-    ####################################### m
-    elif player == 3:
-        if getting_team_name:
-            return 'I dont know how for loops work'
+    as the first character and the most recent round as the last character.
+    They are really HistoryViews, which do everything a string does except
+    pass isinstance(history, str); str(history) gives a real one.
+
+    The strategies themselves live in the registry below; this just looks
+    the player up (by id or name) and calls it. Strategies that make random
+    choices get rng (the random module if not given).'''
+    strategy = _find_strategy(player)
+    if strategy is None:
+        # unknown players have no strategy, like falling off the old elif chain
+        return None
+    if getting_team_name:
+        return strategy.team_name
+    if _sandbox is not None:
+        return _sandbox.call(strategy, history, opponent_history, score,
+                             opponent_score, rng)
+    if _profiler is not None:
+        return _profiler.call(strategy, history, opponent_history, score,
+                              opponent_score, rng)
+    if strategy.takes_rng:
+        return strategy.function(history, opponent_history, score, opponent_score,
+                                 rng if rng is not None else random)
+    return strategy.function(history, opponent_history, score, opponent_score)
+
+
+class Strategy(object):
+    '''One registered team strategy: the player id, the team name and the
+    function that picks 'c' or 'b' given
+    (history, opponent_history, score, opponent_score).
+    Strategies that make random choices should take a fifth argument, rng,
+    and use it instead of the random module so that seeded tournaments can
+    be replayed exactly. Functions without it are called the old way.
+    machine is the strategy's StateMachine, if it has declared one, and
+    memory_one its probabilities of colluding (first, cc, cb, bc, bb) if
+    it is a random memory-one strategy that has declared them.'''
+    def __init__(self, player, team_name, function, machine=None, name=None,
+                 memory_one=None):
+        self.player = player
+        self.team_name = team_name
+        self.function = function
+        self.name = name if name is not None else function.__name__
+        self.takes_rng = 'rng' in inspect.signature(function).parameters
+        self.machine = machine
+        self.memory_one = memory_one
+        self._source_hash = None
+
+    def source_hash(self):
+        '''A hash of the strategy function's source code (None if the
+        source can't be found), used to tell when a team changes its code.'''
+        if self._source_hash is None:
+            try:
+                source = inspect.getsource(self.function)
+            except (OSError, TypeError):
+                return None
+            self._source_hash = source_digest(source)
+        return self._source_hash
+
+    def module_hash(self):
+        '''A hash of the whole file the strategy function is in (None if
+        it can't be found), so that changes to the helpers and constants
+        the function uses are noticed too.'''
+        try:
+            return file_digest(inspect.getsourcefile(self.function))
+        except (OSError, TypeError):
+            return None
+
+    def __call__(self, history, opponent_history, score, opponent_score, rng=None):
+        if self.takes_rng:
+            return self.function(history, opponent_history, score, opponent_score,
+                                 rng if rng is not None else random)
+        return self.function(history, opponent_history, score, opponent_score)
+
+    def __repr__(self):
+        return 'Strategy(%r, %r, %s)' % (self.player, self.team_name, self.name)
+
+
+# player id -> Strategy
+STRATEGIES = {}
+# function name or team name -> player id
+STRATEGY_NAMES = {}
+
+def register_strategy(player, team_name, machine=None, memory=None, name=None,
+                      memory_one=None):
+    '''Decorator that adds a strategy function to the registry under the
+    given player id. The strategy can then be looked up by its id, its
+    function name (or name, if given) or its team name (team names are not
+    unique, so a shared name refers to the lowest id registered with it).
+
+    Strategies that never make random choices or look at the scores, and
+    only ever look at the last few moves, can say so to be played by the
+    vectorized engine: either pass their StateMachine as machine, or pass
+    memory=N if the function only looks at the last N rounds (and at how
+    many rounds have been played, up to N) and let machine_from_function()
+    work out the machine.
+
+    Strategies that make random choices but only look at the last round
+    can pass memory_one=(first, cc, cb, bc, bb), their probability of
+    colluding in the first round and after each outcome of the last round
+    (own move, opponent's move), to be worked out exactly by the analytic
+    engine (see expected_pairing()).'''
+    if memory_one is not None:
+        memory_one = tuple(float(probability) for probability in memory_one)
+        if len(memory_one) != 5 or not all(0 <= probability <= 1
+                                           for probability in memory_one):
+            raise ValueError('memory_one needs 5 probabilities, not %r'
+                             % (memory_one,))
+    def register(function):
+        if player in STRATEGIES:
+            raise ValueError('player %r is already registered as %r'
+                             % (player, STRATEGIES[player]))
+        if memory is not None:
+            declared = machine_from_function(function, memory)
         else:
-            if len(opponent_history)==0: #It's the first round: collude.
-                return 'c'
-            elif history[-1]=='c' and opponent_history[-1]=='c':
-                return 'c' # If they are colluding, collude with them or else betray
-            elif history[-1]=='b' and opponent_history[-1]=='c':
-                return 'b' # If they are colluding, collude with them or else betray
-            elif history[-1]=='c' and opponent_history[-1]=='b':
-                return 'b' # If they are colluding, collude with them or else betray \
-            elif history[0]=='b' and opponent_history[0]=='c':
-                return 'b' # If they are colluding, collude with them or else betray
-            else:
-                return 'b' #otherwise betray
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-    #Team4: Zachary's Team
-    #Team Members: Zach Blum
-    #######################################
-
-
-    elif player == 4:
-        if getting_team_name:
-            return 'Zacharys Team'
-        else:
-            letters = random.randint(0, 1)
-            if len(opponent_history)==0: #It's the first round: collude
-                return 'c'
-            elif letters == 0:
-                return 'b' # betray if they were severely punished last time
-            elif letters == 1:
-                return 'c'
+            declared = machine
+        strategy = Strategy(player, team_name, function, declared, name,
+                            memory_one)
+        STRATEGIES[player] = strategy
+        STRATEGY_NAMES[strategy.name] = player
+        STRATEGY_NAMES.setdefault(team_name, player)
+        return function
+    return register
+
+# strategies can also be plugged in without editing this file, either as
+# modules in the strategies directory next to it or as entry points in this
+# group. A strategy module defines get_action(history, opponent_history,
+# score, opponent_score) (plus rng if it makes random choices) and can set
+# TEAM_NAME, and MEMORY, MACHINE or MEMORY_ONE like register_strategy()'s
+# arguments. The histories it gets are HistoryViews (see get_action()).
+# An entry point can name such a module or just the function.
+STRATEGY_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'strategies')
+ENTRY_POINT_GROUP = 'prisoners_dilemma.strategies'
+
+# (name, directory, player) of every plugin loaded so far, so worker
+# processes that don't inherit this one's memory can load the same ones
+_LOADED_PLUGINS = []
+
+def _entry_points():
+    try:
+        from importlib import metadata
+    except ImportError:
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            return []
+    points = metadata.entry_points()
+    if hasattr(points, 'select'):
+        return list(points.select(group=ENTRY_POINT_GROUP))
+    return list(points.get(ENTRY_POINT_GROUP, []))
+
+def discover_strategies(directory=None):
+    '''
+    Returns {name: source} for every plugin strategy that could be loaded,
+    without importing any of them. source is the module's path for the
+    strategies directory (STRATEGY_DIRECTORY unless given) or the entry
+    point itself.
+    '''
+    if directory is None:
+        directory = STRATEGY_DIRECTORY
+    found = {}
+    for point in _entry_points():
+        found[point.name] = point
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.py') and not filename.startswith('_'):
+                found[filename[:-3]] = os.path.join(directory, filename)
+    return found
+
+def load_strategy(name, directory=None, player=None, found=None):
+    '''
+    Imports the plugin strategy called name (see discover_strategies()) and
+    registers it under player, by default the next free id, returning the
+    id. A strategy that is already registered under name is not loaded
+    again. found is discover_strategies()'s result, if already known.
+    '''
+    if name in STRATEGY_NAMES and STRATEGY_NAMES[name] in STRATEGIES and \
+            STRATEGIES[STRATEGY_NAMES[name]].name == name:
+        return STRATEGY_NAMES[name]
+    if found is None:
+        found = discover_strategies(directory)
+    if name not in found:
+        raise KeyError('no strategy named %r' % name)
+    source = found[name]
+    if isinstance(source, str):
+        import importlib.util
+        spec = importlib.util.spec_from_file_location('strategies.' + name,
+                                                      source)
+        loaded = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(loaded)
+    else:
+        loaded = source.load()
+    function = getattr(loaded, 'get_action', loaded)
+    if player is None:
+        player = max(STRATEGIES) + 1 if STRATEGIES else 0
+    register_strategy(player, getattr(loaded, 'TEAM_NAME', name),
+                      machine=getattr(loaded, 'MACHINE', None),
+                      memory=getattr(loaded, 'MEMORY', None),
+                      name=name,
+                      memory_one=getattr(loaded, 'MEMORY_ONE', None))(function)
+    _LOADED_PLUGINS.append((name, directory, player))
+    return player
+
+def loaded_plugins():
+    '''(name, directory, player) for every plugin strategy loaded so far,
+    for load_plugins() to load the same ones in another process.'''
+    return list(_LOADED_PLUGINS)
+
+def load_plugins(plugins):
+    '''Loads each (name, directory, player) plugin from loaded_plugins()
+    that isn't registered in this process yet, under the same id.'''
+    for name, directory, player in plugins:
+        if player not in STRATEGIES:
+            load_strategy(name, directory, player)
+
+def available_strategies(directory=None):
+    '''The built-in player ids followed by the names of every plugin
+    strategy that isn't loaded yet, in the order main() fills a field.'''
+    names = [name for name in discover_strategies(directory)
+             if name not in STRATEGY_NAMES]
+    return sorted(STRATEGIES) + sorted(names)
+
+def load_field(keys, directory=None):
+    '''
+    Turns a list of player ids and strategy names into the list of player
+    ids for a tournament, importing only the plugins that are in it.
+    '''
+    found = None
+    field = []
+    for key in keys:
+        if isinstance(key, str) and key not in STRATEGY_NAMES:
+            if found is None:
+                found = discover_strategies(directory)
+            key = load_strategy(key, directory, found=found)
+        field.append(lookup_strategy(key).player)
+    if len(set(field)) != len(field):
+        raise ValueError('a strategy can only be in the field once')
+    return field
+
+def _find_strategy(player):
+    # like lookup_strategy(), but None for players that aren't registered
+    return STRATEGIES.get(STRATEGY_NAMES.get(player, player))
+
+def lookup_strategy(key):
+    '''Returns the registered Strategy for a player id or name.
+    Raises KeyError if there is no such strategy.'''
+    if isinstance(key, str):
+        if key not in STRATEGY_NAMES:
+            raise KeyError('no strategy named %r' % key)
+        key = STRATEGY_NAMES[key]
+    if key not in STRATEGIES:
+        raise KeyError('no strategy with id %r' % (key,))
+    return STRATEGIES[key]
+
+# the StrategyProfiler that get_action() reports to, if profiling is on
+_profiler = None
+
+class StrategyProfiler(object):
+    '''
+    Counts the calls, decision time and exceptions of every strategy while
+    it is switched on with profiling(). Times are kept in a histogram with
+    eight buckets per doubling, so the p50/p99 latencies are within about
+    10% and profiles from worker processes can simply be added together.
+    Matches worked out from state machines make no strategy calls, so they
+    don't show up here.
+    '''
+    def __init__(self):
+        # player -> [calls, total seconds, errors, {bucket: count}]
+        self.stats = {}
+        self.last_errors = {}
+
+    def _stats(self, player):
+        if player not in self.stats:
+            self.stats[player] = [0, 0.0, 0, {}]
+        return self.stats[player]
+
+    def call(self, strategy, history, opponent_history, score, opponent_score,
+             rng=None):
+        '''Calls the strategy and records how long it took.'''
+        stats = self._stats(strategy.player)
+        start = time.perf_counter()
+        try:
+            return strategy(history, opponent_history, score, opponent_score, rng)
+        except Exception as error:
+            stats[2] += 1
+            self.last_errors[strategy.player] = repr(error)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            stats[0] += 1
+            stats[1] += elapsed
+            bucket = int(math.log2(elapsed) * 8) if elapsed > 0 else -1000
+            stats[3][bucket] = stats[3].get(bucket, 0) + 1
+
+    def merge(self, other):
+        '''Adds in the counts of another profiler, or of its snapshot().'''
+        stats, last_errors = other if isinstance(other, tuple) else \
+            (other.stats, other.last_errors)
+        for player, (calls, seconds, errors, buckets) in stats.items():
+            mine = self._stats(player)
+            mine[0] += calls
+            mine[1] += seconds
+            mine[2] += errors
+            for bucket, count in buckets.items():
+                mine[3][bucket] = mine[3].get(bucket, 0) + count
+        self.last_errors.update(last_errors)
+
+    def snapshot(self):
+        '''Returns the counts so far (in a picklable form for merge())
+        and starts counting from zero again.'''
+        snapshot = (self.stats, self.last_errors)
+        self.stats = {}
+        self.last_errors = {}
+        return snapshot
+
+    def percentile(self, player, fraction):
+        '''Decision time in seconds that fraction of the player's
+        calls took no longer than.'''
+        calls, seconds, errors, buckets = self.stats[player]
+        needed = fraction * calls
+        seen = 0
+        for bucket in sorted(buckets):
+            seen += buckets[bucket]
+            if seen >= needed:
+                return 2 ** ((bucket + 1) / 8.0)
+        return 0.0
+
+    def report_lines(self, team_names=None):
+        '''One line per strategy, those taking the most time first.
+        team_names is {player: name}, if not the registered names.'''
+        lines = ['player\tcalls\ttotal s\tp50 us\tp99 us\terrors\tname']
+        for player in sorted(self.stats, key=lambda player: -self.stats[player][1]):
+            calls, seconds, errors, buckets = self.stats[player]
+            if team_names is not None and player in team_names:
+                name = team_names[player]
             else:
-                return 'b' #otherwise collude
-
-
-
-
-
-
-
-
-
-
-
-
-    #Team5: Enter Team Name Here
-    #Team Members:
-    #######################################
-
+                name = lookup_strategy(player).team_name
+            if player in self.last_errors:
+                name += ' (last error: %s)' % self.last_errors[player]
+            lines.append('%d\t%d\t%.4f\t%.2f\t%.2f\t%d\t%s' % (
+                player, calls, seconds, self.percentile(player, 0.5) * 1e6,
+                self.percentile(player, 0.99) * 1e6, errors, name))
+        return lines
+
+@contextlib.contextmanager
+def profiling(profiler):
+    '''Sends every strategy call made through get_action() to profiler
+    until the with block ends. Without it get_action() skips all timing.'''
+    global _profiler
+    previous = _profiler
+    _profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _profiler = previous
+
+# the Sandbox that get_action() runs strategies in, if there is one
+_sandbox = None
+
+class StrategyTimeout(BaseException):
+    '''
+    Raised inside a strategy that has run past its time budget. It is a
+    BaseException, like KeyboardInterrupt, so that a strategy's own
+    "except Exception" can't swallow it. args are (kind, message) with
+    kind 'move' or 'match'.
+    '''
 
-    elif player == 5:
-        if getting_team_name:
-            return 'Gavin'
+class Sandbox(object):
+    '''
+    Runs strategies under CPU time budgets: move_budget seconds for any one
+    decision and match_budget seconds for all of a strategy's decisions in
+    one pairing. A decision that runs over, or that raises an exception,
+    counts as default_action (by default ' ', an improper move, so neither
+    player scores that round); a strategy that runs over its match budget
+    forfeits the rest of the pairing the same way.
+    Where interval timers are available (not on Windows, and only in the
+    main thread) a runaway strategy is interrupted by a SIGPROF timer that
+    ticks every quarter budget; elsewhere overruns are only caught once the
+    decision returns.
+    Each kind of violation is counted per player in violations, as
+    {(player, kind): [count, first message]}.
+    '''
+    def __init__(self, move_budget=None, match_budget=None, default_action=' '):
+        self.move_budget = move_budget
+        self.match_budget = match_budget
+        self.default_action = default_action
+        self.violations = {}
+        self._match_used = {}
+        self._forfeited = set()
+        self._call_start = None
+        self._call_player = None
+        self._previous_handler = None
+
+    def __getstate__(self):
+        # only the settings go to worker processes
+        return (self.move_budget, self.match_budget, self.default_action)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def start_match(self):
+        '''Starts the match budgets afresh for a new pairing.'''
+        self._match_used.clear()
+        self._forfeited.clear()
+
+    def _record(self, player, kind, message):
+        if (player, kind) in self.violations:
+            self.violations[player, kind][0] += 1
         else:
-            x = random.randint(0,1)
-            if x == 1:
-                return 'c'
+            self.violations[player, kind] = [1, message]
+
+    def call(self, strategy, history, opponent_history, score, opponent_score,
+             rng=None):
+        '''Calls the strategy within its budgets and returns its action,
+        or default_action if it broke them.'''
+        player = strategy.player
+        if player in self._forfeited:
+            return self.default_action
+        broken = None
+        start = time.process_time()
+        self._call_player = player
+        self._call_start = start
+        try:
+            action = _call_strategy(strategy, history, opponent_history,
+                                    score, opponent_score, rng)
+            self._call_start = None
+        except StrategyTimeout as timeout:
+            self._call_start = None
+            broken = timeout.args[0]
+            self._record(player, broken, timeout.args[1])
+            action = self.default_action
+        except Exception as error:
+            self._call_start = None
+            self._record(player, 'error', repr(error))
+            action = self.default_action
+        used = time.process_time() - start
+        total = self._match_used.get(player, 0.0) + used
+        self._match_used[player] = total
+        # without a timer, overruns can only be caught here, afterwards
+        if broken is None and self.move_budget is not None and \
+                used > self.move_budget:
+            broken = 'move'
+            self._record(player, broken, 'took %.3fs' % used)
+            action = self.default_action
+        if self.match_budget is not None and total > self.match_budget:
+            if broken != 'match':
+                self._record(player, 'match', 'used %.3fs' % total)
+            self._forfeited.add(player)
+            action = self.default_action
+        return action
+
+    def _tick(self, signum, frame):
+        start = self._call_start
+        # never interrupt call() itself, only the strategy it is running
+        if start is None or frame is None or \
+                frame.f_code is Sandbox.call.__code__:
+            return
+        used = time.process_time() - start
+        if self.move_budget is not None and used > self.move_budget:
+            self._call_start = None
+            raise StrategyTimeout('move', 'interrupted after %.3fs' % used)
+        used += self._match_used.get(self._call_player, 0.0)
+        if self.match_budget is not None and used > self.match_budget:
+            self._call_start = None
+            raise StrategyTimeout('match', 'interrupted after %.3fs' % used)
+
+    def arm(self):
+        '''Starts the SIGPROF timer, if this platform and thread allow it.
+        Returns whether it did.'''
+        import signal
+        import threading
+        budgets = [budget for budget in (self.move_budget, self.match_budget)
+                   if budget is not None]
+        if not budgets or not hasattr(signal, 'setitimer') or \
+                threading.current_thread() is not threading.main_thread():
+            return False
+        self._previous_handler = signal.signal(signal.SIGPROF, self._tick)
+        interval = max(min(budgets) / 4.0, 0.001)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        return True
+
+    def disarm(self):
+        import signal
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler)
+
+    def merge(self, violations):
+        '''Adds in violations counted elsewhere (see snapshot()).'''
+        for key, (count, message) in violations.items():
+            if key in self.violations:
+                self.violations[key][0] += count
             else:
-                return 'b'
-
-
-
-
-
-
-
-
-
-
-
-
-    #Team6: Enter Team Name Here
-    #Team Members:
-    #######################################
-
-    elif player == 6:
-        if getting_team_name:
-            return 'unoffical2'
-        else:
-            if len(opponent_history) == 0:  # It's the first round: collude
-                return 'c'
-            elif history[-1] == 'c' and opponent_history[-1] == 'b':
-                return 'b'  # betray if they were severely punished last time
-            elif history[-1] == 'b':
-                return 'b'
+                self.violations[key] = [count, message]
+
+    def snapshot(self):
+        '''Returns the violations so far and starts counting afresh.'''
+        violations = self.violations
+        self.violations = {}
+        return violations
+
+    def report_lines(self, team_names=None):
+        '''One line per player and kind of violation.
+        team_names is {player: name}, if not the registered names.'''
+        lines = ['player\tbroke\ttimes\tfirst\tname']
+        for (player, kind), (count, message) in sorted(self.violations.items()):
+            if team_names is not None and player in team_names:
+                name = team_names[player]
             else:
-                return 'c'
-
-    #Team7: Enter Team Name Here
-    #Team Members:
-    #######################################
-
-
-    elif player == 7:
-        if getting_team_name:
-            return 'Will F Team'
-        else:
-            if len(opponent_history) == 0:
-                return 'c'
-            elif history[-1] == 'b' and opponent_history[-1] == 'b':
-                return 'b'
-            elif history[-1] == 'c' and opponent_history[-1] == 'b':
-                return 'b'
-            elif history[-1] == 'b' and opponent_history[-1] == 'c':
-                return 'c'
+                name = lookup_strategy(player).team_name
+            lines.append('%d\t%s\t%d\t%s\t%s' % (player, kind, count,
+                                                 message, name))
+        return lines
+
+def _call_strategy(strategy, history, opponent_history, score, opponent_score,
+                   rng):
+    # a strategy call from the sandbox, still going through the profiler
+    if _profiler is not None:
+        return _profiler.call(strategy, history, opponent_history, score,
+                              opponent_score, rng)
+    return strategy(history, opponent_history, score, opponent_score, rng)
+
+@contextlib.contextmanager
+def sandboxed(sandbox):
+    '''Runs every strategy call made through get_action() in sandbox
+    until the with block ends.'''
+    global _sandbox
+    previous = _sandbox
+    _sandbox = sandbox
+    armed = sandbox.arm()
+    try:
+        yield sandbox
+    finally:
+        if armed:
+            sandbox.disarm()
+        _sandbox = previous
+
+class StateMachine(object):
+    '''
+    A deterministic strategy written as a finite-state machine.
+    actions[state] is the move ('c' or 'b') played in that state and
+    transitions[state] is a pair (next state if the opponent colluded,
+    next state if the opponent betrayed). Play begins in state start.
+    '''
+    def __init__(self, actions, transitions, start=0):
+        if len(actions) != len(transitions):
+            raise ValueError('need one pair of transitions per state')
+        for action in actions:
+            if action not in ('c', 'b'):
+                raise ValueError('state machine actions must be c or b, not %r'
+                                 % (action,))
+        for pair in transitions:
+            if len(pair) != 2 or not all(0 <= state < len(actions)
+                                         for state in pair):
+                raise ValueError('bad state machine transition %r' % (pair,))
+        if not 0 <= start < len(actions):
+            raise ValueError('start state %r out of range' % (start,))
+        self.actions = tuple(actions)
+        self.transitions = tuple(tuple(pair) for pair in transitions)
+        self.start = start
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __repr__(self):
+        return 'StateMachine(%r, %r, %r)' % (''.join(self.actions),
+                                             self.transitions, self.start)
+
+def lookup_table(first, cc, cb, bc, bb):
+    '''
+    Builds the StateMachine for a memory-one strategy given as a lookup
+    table: the first move, then the move after each outcome of the last
+    round, named by (own move, opponent's move). Loyal Vengeful, for
+    example, is lookup_table('c', cc='c', cb='b', bc='c', bb='c').
+    '''
+    table = (first, cc, cb, bc, bb)
+    # state 0 is the first round, states 1-4 remember the last outcome
+    def after(action, opponent_action):
+        return 1 + 2*(action == 'b') + (opponent_action == 'b')
+    return StateMachine(table,
+                        [(after(action, 'c'), after(action, 'b'))
+                         for action in table])
+
+def machine_from_function(function, memory):
+    '''
+    Builds the StateMachine for a strategy function that only looks at the
+    last memory rounds of both histories (and so cannot tell apart rounds
+    past the memory-th). Each state is the pair of history windows the
+    function would see; only the reachable ones are built.
+    '''
+    if 'rng' in inspect.signature(function).parameters:
+        raise ValueError('%s makes random choices, so it is not a state machine'
+                         % function.__name__)
+    start = ('', '')
+    states = {start: 0}
+    windows = [start]
+    actions = []
+    transitions = []
+    for history, opponent_history in windows:
+        action = function(history, opponent_history, 0, 0)
+        if action not in ('c', 'b'):
+            raise ValueError('%s returned %r after %r/%r, so it is not a state '
+                             'machine' % (function.__name__, action,
+                                          history, opponent_history))
+        actions.append(action)
+        pair = []
+        for opponent_action in 'cb':
+            if memory:
+                window = ((history + action)[-memory:],
+                          (opponent_history + opponent_action)[-memory:])
             else:
-                return 'c'
-
-
-
-
-
+                window = start
+            if window not in states:
+                # appending while looping over windows visits it later
+                states[window] = len(windows)
+                windows.append(window)
+            pair.append(states[window])
+        transitions.append(pair)
+    return minimize_machine(StateMachine(actions, transitions))
+
+def minimize_machine(machine):
+    '''
+    Returns the smallest StateMachine that plays the same as machine,
+    by merging states that can never be told apart (Moore's algorithm).
+    '''
+    # start by splitting the states on the move they play, then keep
+    # splitting on where they go next until nothing changes
+    classes = [machine.actions.index(action) for action in machine.actions]
+    while True:
+        signatures = [(classes[state], classes[after_c], classes[after_b])
+                      for state, (after_c, after_b)
+                      in enumerate(machine.transitions)]
+        numbering = {}
+        refined = [numbering.setdefault(signature, len(numbering))
+                   for signature in signatures]
+        if len(numbering) == len(set(classes)):
+            break
+        classes = refined
+    # number the merged states in the order play reaches them from the start
+    order = {classes[machine.start]: 0}
+    queue = [machine.start]
+    for state in queue:
+        for next_state in machine.transitions[state]:
+            if classes[next_state] not in order:
+                order[classes[next_state]] = len(order)
+                queue.append(next_state)
+    actions = [None] * len(order)
+    transitions = [None] * len(order)
+    for state in queue:
+        merged = order[classes[state]]
+        actions[merged] = machine.actions[state]
+        transitions[merged] = [order[classes[next_state]]
+                               for next_state in machine.transitions[state]]
+    return StateMachine(actions, transitions)
 
 
+#TEAMS 0-2 ARE EXAMPLE TEAMS
 
 
+#Team0: Loyal
+# This example player always colludes
+#######################################
 
 
+@register_strategy(0, 'Loyal', memory=0)
+def loyal(history, opponent_history, score, opponent_score):
+    return 'c'
 
 
 
+#Team1: Backstabber
+# This example player always betrays
+#######################################
 
-    #Team8: Enter Team Name Here
-    #Team Members:
-    #######################################
 
+@register_strategy(1, 'Backstabber', memory=0)
+def backstabber(history, opponent_history, score, opponent_score):
+    return 'b'
 
-    elif player == 8:
-        if getting_team_name:
-            return 'Enter Team Name Here'
-        else:
-            if len(opponent_history)==0: #It's the first round: collude
-                return 'c'
-            elif history[-1]=='c' and opponent_history[-1]=='b':
-                return 'b' # betray if they were severely punished last time
-            else:
-                return 'c' #otherwise collude
 
 
+#Team2: Loyal Vengeful
+#This example player is silent at first and then only betrays if they were a sucker last round.
+#######################################
 
 
+@register_strategy(2, 'Loyal Vengeful', memory=1)
+def loyal_vengeful(history, opponent_history, score, opponent_score):
+    if len(opponent_history)==0: #It's the first round: collude
+        return 'c'
+    elif history[-1]=='c' and opponent_history[-1]=='b':
+        return 'b' # betray if they were severely punished last time
+    else:
+        return 'c' #otherwise collude
 
 
+# EACH STUDENT TEAM CAN CHANGE ONE OF THESE STRATEGY FUNCTIONS BELOW
+#######################################################################
 
 
 
 
+#Team3: Enter Team Name Here I don't know how for loops work
+#Team Members: Kai
+####################################### m
+@register_strategy(3, 'I dont know how for loops work', memory=1)
+def team3(history, opponent_history, score, opponent_score):
+    if len(opponent_history)==0: #It's the first round: collude.
+        return 'c'
+    elif history[-1]=='c' and opponent_history[-1]=='c':
+        return 'c' # If they are colluding, collude with them or else betray
+    elif history[-1]=='b' and opponent_history[-1]=='c':
+        return 'b' # If they are colluding, collude with them or else betray
+    elif history[-1]=='c' and opponent_history[-1]=='b':
+        return 'b' # If they are colluding, collude with them or else betray \
+    elif history[0]=='b' and opponent_history[0]=='c':
+        return 'b' # If they are colluding, collude with them or else betray
+    else:
+        return 'b' #otherwise betray
 
 
 
+#Team4: Zachary's Team
+#Team Members: Zach Blum
+#######################################
 
 
-    #Team9: Enter Team Name Here
-    #Team Members:
-    #######################################
+@register_strategy(4, 'Zacharys Team', memory_one=(1, 0.5, 0.5, 0.5, 0.5))
+def team4(history, opponent_history, score, opponent_score, rng):
+    letters = rng.randint(0, 1)
+    if len(opponent_history)==0: #It's the first round: collude
+        return 'c'
+    elif letters == 0:
+        return 'b' # betray if they were severely punished last time
+    elif letters == 1:
+        return 'c'
+    else:
+        return 'b' #otherwise collude
 
 
-    elif player == 9:
-        if getting_team_name:
-            return 'AI'
-        else:
-            if len(opponent_history)==0: #It's the first round: collude
-                return 'c'
-            elif opponent_history[-1]=='b':
-                return 'b' # betray if they were severely punished last time
-            elif opponent_history[-1]=='c':
-                return 'c'
-            else:
-                return 'c' #otherwise collude
 
+#Team5: Enter Team Name Here
+#Team Members:
+#######################################
 
 
+@register_strategy(5, 'Gavin', memory_one=(0.5, 0.5, 0.5, 0.5, 0.5))
+def team5(history, opponent_history, score, opponent_score, rng):
+    x = rng.randint(0,1)
+    if x == 1:
+        return 'c'
+    else:
+        return 'b'
 
 
 
+#Team6: Enter Team Name Here
+#Team Members:
+#######################################
 
+@register_strategy(6, 'unoffical2', memory=1)
+def team6(history, opponent_history, score, opponent_score):
+    if len(opponent_history) == 0:  # It's the first round: collude
+        return 'c'
+    elif history[-1] == 'c' and opponent_history[-1] == 'b':
+        return 'b'  # betray if they were severely punished last time
+    elif history[-1] == 'b':
+        return 'b'
+    else:
+        return 'c'
+
+#Team7: Enter Team Name Here
+#Team Members:
+#######################################
+
+
+@register_strategy(7, 'Will F Team', memory=1)
+def team7(history, opponent_history, score, opponent_score):
+    if len(opponent_history) == 0:
+        return 'c'
+    elif history[-1] == 'b' and opponent_history[-1] == 'b':
+        return 'b'
+    elif history[-1] == 'c' and opponent_history[-1] == 'b':
+        return 'b'
+    elif history[-1] == 'b' and opponent_history[-1] == 'c':
+        return 'c'
+    else:
+        return 'c'
 
 
 
+#Team8: Enter Team Name Here
+#Team Members:
+#######################################
 
 
+@register_strategy(8, 'Enter Team Name Here', memory=1)
+def team8(history, opponent_history, score, opponent_score):
+    if len(opponent_history)==0: #It's the first round: collude
+        return 'c'
+    elif history[-1]=='c' and opponent_history[-1]=='b':
+        return 'b' # betray if they were severely punished last time
+    else:
+        return 'c' #otherwise collude
 
 
 
-    #Team10: Sir_Theodore_III(His squire:Jacobson
-    #Team Members: Will Jacobson
-    #######################################
+#Team9: Enter Team Name Here
+#Team Members:
+#######################################
 
 
-    elif player == 10:
-        if getting_team_name:
-            return 'Sir_Theodore_III(His squire:Jacobson'
-        else:
-            if len(opponent_history)==0: #It's the first round: collude
-                return 'c'
-            elif len(opponent_history) == 1:
-                return 'b'
-            elif len(opponent_history) == 2:
-                return 'c'
-            elif history[-1]=='c' and opponent_history[-1]=='b':
-                return 'b' # betray if they were severely punished last time
-            elif history[-1] == 'c' and opponent_history[-1] == 'c':
-                return 'b'
-            else:
-                return 'b' #otherwise collude
+@register_strategy(9, 'AI', memory=1)
+def team9(history, opponent_history, score, opponent_score):
+    if len(opponent_history)==0: #It's the first round: collude
+        return 'c'
+    elif opponent_history[-1]=='b':
+        return 'b' # betray if they were severely punished last time
+    elif opponent_history[-1]=='c':
+        return 'c'
+    else:
+        return 'c' #otherwise collude
 
 
 
+#Team10: Sir_Theodore_III(His squire:Jacobson
+#Team Members: Will Jacobson
+#######################################
 
 
+@register_strategy(10, 'Sir_Theodore_III(His squire:Jacobson', memory=3)
+def team10(history, opponent_history, score, opponent_score):
+    if len(opponent_history)==0: #It's the first round: collude
+        return 'c'
+    elif len(opponent_history) == 1:
+        return 'b'
+    elif len(opponent_history) == 2:
+        return 'c'
+    elif history[-1]=='c' and opponent_history[-1]=='b':
+        return 'b' # betray if they were severely punished last time
+    elif history[-1] == 'c' and opponent_history[-1] == 'c':
+        return 'b'
+    else:
+        return 'b' #otherwise collude
 
 
 
 #394
-    #Team11: Enter Team Name Here
-    #Team Members:
-    #######################################
-
-
-    elif player == 11:
-        if getting_team_name:
-            return 'Placeholder Team Name (v2)'
-        else:
-            if len(opponent_history) == 0: #It's the first round: collude
-                return 'c'
-            elif history[-1] == 'c' and opponent_history[-1] == 'b':
-                return 'b'
-            elif history[-1] == 'b':
-                return 'b'
-            else:
-                return 'c'
+#Team11: Enter Team Name Here
+#Team Members:
+#######################################
+
+
+@register_strategy(11, 'Placeholder Team Name (v2)', memory=1)
+def team11(history, opponent_history, score, opponent_score):
+    if len(opponent_history) == 0: #It's the first round: collude
+        return 'c'
+    elif history[-1] == 'c' and opponent_history[-1] == 'b':
+        return 'b'
+    elif history[-1] == 'b':
+        return 'b'
+    else:
+        return 'c'
 # Why don’t orphans work as computer repair technicians?  Because they can’t find the motherboard
 # The oldest computer can be traced back to Adam and Eve. It was an apple but with extremely limited memory. Just 1 byte. And then everything crashed. XDXDXD
 # Where did the software developer go?! I don’t know, he ransomware!
@@ -415,393 +1408,1524 @@ def get_action(player, history, opponent_history, score, opponent_score, getting
 # Some people are like a software update. When I see them I think, “Not now.”
 # Everyone's telling me to stop typing bad jokes or else they'll slam my head into the keyboard, but I don't think I ajlkfsdhnvkwr;anhfkclajwefvuqigqrw'
 # So I want to dress up as a UDP packet for Halloween, but I don’t know if anyone will get it. XDXDXD
-    #Team12: Enter Team Name Here
-    #Team Members:
-    #######################################
-
-
-    elif player == 12:
-        jedi_points=0
-        sith_points=0
-        if getting_team_name:
-            return 'Aidan'
-        elif jedi_points==1:
-            print("The jedi way, revenge is not.")
-        elif sith_points==1:
-            print("Easier, the path to the dark side is")
-        else:
-            if len(opponent_history)==0:   #It's the first round: collude
-                return 'c'
-            elif opponent_history[-1]=='b':
-                return 'b' # betray if they were severely punished last time
-            elif opponent_history[-1]=='c' and history[-1]=='b':
-                return 'b'
-            elif opponent_history[-1]=='c' and history[-1]=='c':
-                return 'c'
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-    #Team13: Diabetes Fetus (Landen)
-    #Team Members:
-    #######################################
-    elif player == 13:
-        if getting_team_name:
-            return 'Diabetes Fetus (Landen)'
-        else:
-            if len(opponent_history)<=2:
-                if len(opponent_history)==0: #It's the first round: collude
-                    return 'c'
-                elif opponent_history[-1]=='b':
-                    return 'b'
-                elif opponent_history[-1]=='c':
-                    return 'c'
-            elif len(opponent_history)>2 and len(opponent_history)<=3:
-                if opponent_history[-2]=='c':
-                    return 'b'
-                else:
-                   return 'c'
-            elif len(opponent_history)>3:
-                if opponent_history[-3]=='b':
-                    return 'b'
-                elif opponent_history[-3]=='c':
-                    return 'c'
-            elif len(opponent_history)>7:
-                if opponent_history[-7]=='b':
-                    return 'c'
-                elif opponent_history[-7]=='c':
-                    return 'b'
-
-    #Team14: Preposterous Pingus
-    #Team Members:
-    #######################################
-
-#Work
-    elif player == 14:
-        if getting_team_name:
-            return 'Enter Team Name Here'
-        else:
-            okay=random.randint(1,3)
-            if okay==1 or okay==2:
-                    return 'b'
-            elif okay==3:
-                    return 'c'
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-    #Team15: Bald Boy (Gabe in case you were confused) Team Members: Gabe Van Haecke
-    elif player == 15:
-        betray = 0
-        collude = 0
-        if getting_team_name: return 'Bald Boy (Gabe in case you were confused)'
-        else:
-            def patterncheck(start, end):
-                if opponent_history[start:start + 5] == opponent_history[end - 5:end]: return 6
-                elif opponent_history[start:start + 3] == opponent_history[end - 3:end]: return 4
-                elif opponent_history[start:start + 2] == opponent_history[end-2:end]: return 3
-                else: return 0
-            def patternres():
-                if opponent_history[0 + (len(history) - 12)] == "b": return "b"
-                else:
-                    if random.randint(1, 100) > 5: return "b"
-                    else: return "c"
-            if len(history) <= 11:
-                start = "ccccbcbcbbbb"
-                return start[len(history)]
-            elif patterncheck((len(history)%2)*12-1, (len(history)%2)*12) > 0: return patternres()
-            else:
-                if opponent_history[1:11] == history[0:10]: return "c"
-                else:
-                    for i in opponent_history[len(history)-11:len(history)-1]:
-                        if i == "b": betray += 1
-                        elif i == "c": collude += 1
-                    if betray >= collude: return "b"
-                    else:
-                        if random.randint(1, 100) > 10: return "c"
-                        else: return "b"
-
-    #Team16: Enter Team Name Here
-    #Team Members:
-    #######################################
-
-
-    elif player == 16:
-        if getting_team_name:
-            return 'Enter Team Name Here'
-        else:
-            if len(opponent_history)==0: #It's the first round: collude
-                return 'c'
-            elif history[-1]=='c' and opponent_history[-1]=='b':
-                return 'b' # betray if they were severely punished last time
-            else:
-                return 'c' #otherwise collude
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+#Team12: Enter Team Name Here
+#Team Members:
+#######################################
+
+
+@register_strategy(12, 'Aidan', memory=1)
+def team12(history, opponent_history, score, opponent_score):
+    jedi_points=0
+    sith_points=0
+    if jedi_points==1:
+        print("The jedi way, revenge is not.")
+    elif sith_points==1:
+        print("Easier, the path to the dark side is")
+    else:
+        if len(opponent_history)==0:   #It's the first round: collude
+            return 'c'
+        elif opponent_history[-1]=='b':
+            return 'b' # betray if they were severely punished last time
+        elif opponent_history[-1]=='c' and history[-1]=='b':
+            return 'b'
+        elif opponent_history[-1]=='c' and history[-1]=='c':
+            return 'c'
 
-    #Team17: Enter Team Name Here
-    #Team Members:
-    #######################################
 
 
-    elif player == 17:
-        if getting_team_name:
-            return 'Enter Team Name Here'
+#Team13: Diabetes Fetus (Landen)
+#Team Members:
+#######################################
+@register_strategy(13, 'Diabetes Fetus (Landen)', memory=4)
+def team13(history, opponent_history, score, opponent_score):
+    if len(opponent_history)<=2:
+        if len(opponent_history)==0: #It's the first round: collude
+            return 'c'
+        elif opponent_history[-1]=='b':
+            return 'b'
+        elif opponent_history[-1]=='c':
+            return 'c'
+    elif len(opponent_history)>2 and len(opponent_history)<=3:
+        if opponent_history[-2]=='c':
+            return 'b'
         else:
-            if len(opponent_history)==0: #It's the first round: collude
-                return 'c'
-            elif history[-1]=='c' and opponent_history[-1]=='b':
-                return 'b' # betray if they were severely punished last time
-            else:
-                return 'c' #otherwise collude
-
-
-
-
-
-
-
-
-
-
-
-
+           return 'c'
+    elif len(opponent_history)>3:
+        if opponent_history[-3]=='b':
+            return 'b'
+        elif opponent_history[-3]=='c':
+            return 'c'
+    elif len(opponent_history)>7:
+        if opponent_history[-7]=='b':
+            return 'c'
+        elif opponent_history[-7]=='c':
+            return 'b'
 
+#Team14: Preposterous Pingus
+#Team Members:
+#######################################
 
+#Work
+@register_strategy(14, 'Enter Team Name Here', memory_one=(1/3, 1/3, 1/3, 1/3, 1/3))
+def team14(history, opponent_history, score, opponent_score, rng):
+    okay=rng.randint(1,3)
+    if okay==1 or okay==2:
+            return 'b'
+    elif okay==3:
+            return 'c'
 
-    #Team18: Enter Team Name Here
-    #Team Members:
-    #######################################
 
 
-    elif player == 18:
-        if getting_team_name:
-            return 'Enter Team Name Here'
+#Team15: Bald Boy (Gabe in case you were confused) Team Members: Gabe Van Haecke
+@register_strategy(15, 'Bald Boy (Gabe in case you were confused)')
+def team15(history, opponent_history, score, opponent_score, rng):
+    betray = 0
+    collude = 0
+    def patterncheck(start, end):
+        if opponent_history[start:start + 5] == opponent_history[end - 5:end]: return 6
+        elif opponent_history[start:start + 3] == opponent_history[end - 3:end]: return 4
+        elif opponent_history[start:start + 2] == opponent_history[end-2:end]: return 3
+        else: return 0
+    def patternres():
+        if opponent_history[0 + (len(history) - 12)] == "b": return "b"
         else:
-            if len(opponent_history)==0: #It's the first round: collude
-                return 'c'
-            elif history[-1]=='c' and opponent_history[-1]=='b':
-                return 'b' # betray if they were severely punished last time
-            else:
-                return 'c' #otherwise collude
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-    #Team19: Enter Team Name Here
-    #Team Members:
-    #######################################
-
-
-    elif player == 19:
-        if getting_team_name:
-            return 'Enter Team Name Here'
+            if rng.randint(1, 100) > 5: return "b"
+            else: return "c"
+    if len(history) <= 11:
+        start = "ccccbcbcbbbb"
+        return start[len(history)]
+    elif patterncheck((len(history)%2)*12-1, (len(history)%2)*12) > 0: return patternres()
+    else:
+        if opponent_history[1:11] == history[0:10]: return "c"
         else:
-            if len(opponent_history)==0: #It's the first round: collude
-                return 'c'
-            elif history[-1]=='c' and opponent_history[-1]=='b':
-                return 'b' # betray if they were severely punished last time
+            for i in opponent_history[len(history)-11:len(history)-1]:
+                if i == "b": betray += 1
+                elif i == "c": collude += 1
+            if betray >= collude: return "b"
             else:
-                return 'c' #otherwise collude
-
-
-
-
-
-
-
-
-
+                if rng.randint(1, 100) > 10: return "c"
+                else: return "b"
 
+#Team16: Enter Team Name Here
+#Team Members:
+#######################################
 
 
+@register_strategy(16, 'Enter Team Name Here', memory=1)
+def team16(history, opponent_history, score, opponent_score):
+    if len(opponent_history)==0: #It's the first round: collude
+        return 'c'
+    elif history[-1]=='c' and opponent_history[-1]=='b':
+        return 'b' # betray if they were severely punished last time
+    else:
+        return 'c' #otherwise collude
 
 
 
-    #Team20: Enter Team Name Here
-    #Team Members:
-    #######################################
+#Team17: Enter Team Name Here
+#Team Members:
+#######################################
 
 
-    elif player == 20:
-        if getting_team_name:
-            return 'Enter Team Name Here'
-        else:
-            if len(opponent_history)==0: #It's the first round: collude
-                return 'c'
-            elif history[-1]=='c' and opponent_history[-1]=='b':
-                return 'b' # betray if they were severely punished last time
-            else:
-                return 'c' #otherwise collude
+@register_strategy(17, 'Enter Team Name Here', memory=1)
+def team17(history, opponent_history, score, opponent_score):
+    if len(opponent_history)==0: #It's the first round: collude
+        return 'c'
+    elif history[-1]=='c' and opponent_history[-1]=='b':
+        return 'b' # betray if they were severely punished last time
+    else:
+        return 'c' #otherwise collude
 
 
 
+#Team18: Enter Team Name Here
+#Team Members:
+#######################################
 
 
+@register_strategy(18, 'Enter Team Name Here', memory=1)
+def team18(history, opponent_history, score, opponent_score):
+    if len(opponent_history)==0: #It's the first round: collude
+        return 'c'
+    elif history[-1]=='c' and opponent_history[-1]=='b':
+        return 'b' # betray if they were severely punished last time
+    else:
+        return 'c' #otherwise collude
 
 
 
+#Team19: Enter Team Name Here
+#Team Members:
+#######################################
 
 
+@register_strategy(19, 'Enter Team Name Here', memory=1)
+def team19(history, opponent_history, score, opponent_score):
+    if len(opponent_history)==0: #It's the first round: collude
+        return 'c'
+    elif history[-1]=='c' and opponent_history[-1]=='b':
+        return 'b' # betray if they were severely punished last time
+    else:
+        return 'c' #otherwise collude
 
 
-def play_tournament(num_players):
-    #create a list of zeros, one per player
-    scores = []
-    for i in range(num_players):
-        scores += [0]
 
+#Team20: Enter Team Name Here
+#Team Members:
+#######################################
 
-    ''' Get the team name from each team algorithm'''
-    #create a list of the right length
-    team_names = list(range(num_players))
-    for player in range(num_players):
-        team_names[player] = get_action(player,'','',0,0,getting_team_name=True)
 
-    # each element will become a column for each player
-    # range is just to get list of correct size
-    result_table=list(range(num_players))
-    moves_table=list(range(num_players))
+@register_strategy(20, 'Enter Team Name Here', memory=1)
+def team20(history, opponent_history, score, opponent_score):
+    if len(opponent_history)==0: #It's the first round: collude
+        return 'c'
+    elif history[-1]=='c' and opponent_history[-1]=='b':
+        return 'b' # betray if they were severely punished last time
+    else:
+        return 'c' #otherwise collude
+
+
+
+
+# 2-bit move codes used when packing a pairing's moves: 'c' is 0, 'b' is 1
+# and anything else (an improper action) is 2
+_MOVE_CODES = bytearray([2]) * 256
+_MOVE_CODES[ord('c')] = 0
+_MOVE_CODES[ord('b')] = 1
+_MOVE_CODES = bytes(_MOVE_CODES)
+# split a packed byte back into its two rounds
+_HIGH_NIBBLE = bytes(code >> 4 for code in range(256))
+_LOW_NIBBLE = bytes(code & 15 for code in range(256))
+# and a round's nibble back into each player's move
+_NIBBLE_MOVES1 = bytes(b'cb  '[(code >> 2) & 3] for code in range(256))
+_NIBBLE_MOVES2 = bytes(b'cb  '[code & 3] for code in range(256))
+
+def _round_nibbles(moves1, moves2):
+    # one byte per round, holding player1's move code * 4 + player2's
+    if isinstance(moves1, str):
+        moves1 = moves1.encode('latin-1', 'replace')
+    if isinstance(moves2, str):
+        moves2 = moves2.encode('latin-1', 'replace')
+    codes1 = bytes(moves1).translate(_MOVE_CODES)
+    codes2 = bytes(moves2).translate(_MOVE_CODES)
+    # every byte is at most 2, so this big-number sum never carries
+    # between bytes
+    return (int.from_bytes(codes1, 'big') * 4 +
+            int.from_bytes(codes2, 'big')).to_bytes(len(codes1), 'big')
+
+def pack_moves(moves1, moves2):
+    '''
+    Packs both players' moves from one pairing into bytes, 2 bits per
+    player per round, so each byte holds two rounds.
+    Improper moves (anything but 'c' or 'b') all come back as ' '.
+    Use unpack_moves(packed, rounds) to get the strings back.
+    '''
+    nibbles = _round_nibbles(moves1, moves2)
+    if len(nibbles) % 2:
+        nibbles += b'\0'
+    # and this one, likewise, puts two nibbles in each byte
+    size = len(nibbles)
+    return (int.from_bytes(nibbles[0::2], 'big') * 16 +
+            int.from_bytes(nibbles[1::2], 'big')).to_bytes(size // 2, 'big')
+
+def _unpack_nibbles(packed, rounds):
+    # one byte per round, holding that round's nibble
+    packed = bytes(packed)
+    nibbles = bytearray(2 * len(packed))
+    nibbles[0::2] = packed.translate(_HIGH_NIBBLE)
+    nibbles[1::2] = packed.translate(_LOW_NIBBLE)
+    del nibbles[rounds:]
+    return nibbles
+
+def unpack_moves(packed, rounds):
+    '''
+    Reverses pack_moves(), returning the (moves1, moves2) strings
+    for a pairing that lasted the given number of rounds.
+    '''
+    nibbles = _unpack_nibbles(packed, rounds)
+    return (nibbles.translate(_NIBBLE_MOVES1).decode('latin-1'),
+            nibbles.translate(_NIBBLE_MOVES2).decode('latin-1'))
 
+def outcome_counts(packed, rounds):
+    '''
+    Counts how the rounds of a pairing packed by pack_moves() ended:
+    returns (cc, cb, bc, bb), named by (player1's move, player2's move).
+    Rounds with an improper move aren't counted, as they score nothing.
+    Payoffs.score() turns these into scores for any payoffs.
+    '''
+    nibbles = _unpack_nibbles(packed, rounds)
+    # a nibble is player1's move code * 4 + player2's
+    return (nibbles.count(0), nibbles.count(1), nibbles.count(4),
+            nibbles.count(5))
 
-    for player1 in range(num_players):
-        # create the column for each player
-        # range just to get list of correct size
-        result_table[player1]=list(range(num_players))
-        result_table[player1][player1]=0 # initialize unused diagonal to 0
-        moves_table[player1]=list(range(num_players))
-        # play a game between with every other player of lower number
-        for player2 in range(player1):
-            moves1, moves2, score1, score2 = \
-                play_iterative_rounds(player1, player2)
-
-            rounds = len(moves1)
-            score1_per_round = score1/rounds
-            score2_per_round = score2/rounds
-
-            result_table[player1][player2]=score1_per_round
-            result_table[player2][player1]=score2_per_round
-
-            moves_table[player1][player2] = moves1
-            moves_table[player2][player1] = moves2
-
-            #accumulate the results for the two players
-            scores[player1] += score1*1.0/len(moves1)#ends up same as column sum
-            scores[player2] += score2*1.0/len(moves2)#ends up same as column sum
-
-    '''report round-level results in a data file'''
-    use_datafile=True
-    if use_datafile:
-        # use the same directory as the python script
-        import os.path
-        directory = os.path.dirname(os.path.abspath(__file__))
+# rounds both players colluded in as b'c', the rest as b' ', by nibble
+_MUTUAL_COLLUSION = bytes(b'c'[0] if code == 0 else b' '[0] for code in range(256))
 
-        #name the file tournament.txt
-        filename = os.path.join(directory, 'tournament.txt')
-        #create the file for the round-by-round results
-        results = open(filename,'w')
-        for player1 in range(num_players):
-            for player2 in range(player1):
-                # store the results in the file
-                #title by team numbers
-                results.write('team ' + str(player1) +
-                              ' vs. ' + 'team ' + str(player2) +'\n')
-                #title by player-on-player average score
-                results.write(str(result_table[player1][player2]) +
-                              ' vs. ' + str(result_table[player2][player1])+'\n')
-                #title by team names
-                results.write(team_names[player1] +
-                             ' vs. ' + team_names[player2] + '\n')
-                #show the moves, aligned vertically
-                results.write(moves_table[player1][player2] +'\n')
-                results.write(moves_table[player2][player1] +'\n')
-                #blank line between each pair's results
-                results.write('\n')
+class MatchSummary(object):
+    '''
+    The compact record of one match, kept instead of its moves when they
+    aren't needed: how many rounds it lasted, how many rounds ended each
+    way (cc, cb, bc and bb, named by (player1's move, player2's move)),
+    the round each player first betrayed in (counting from 0, None if it
+    never did) and the longest run of rounds both players colluded in.
+    play_iterative_rounds() fills one in as the match ends.
+    '''
+    __slots__ = ('rounds', 'cc', 'cb', 'bc', 'bb', 'first_betrayal1',
+                 'first_betrayal2', 'longest_collusion')
+
+    def __init__(self, rounds=0, cc=0, cb=0, bc=0, bb=0, first_betrayal1=None,
+                 first_betrayal2=None, longest_collusion=0):
+        self.rounds = rounds
+        self.cc = cc
+        self.cb = cb
+        self.bc = bc
+        self.bb = bb
+        self.first_betrayal1 = first_betrayal1
+        self.first_betrayal2 = first_betrayal2
+        self.longest_collusion = longest_collusion
+
+    @classmethod
+    def from_moves(cls, moves1, moves2):
+        '''Summarizes a match from both players' moves.'''
+        summary = cls()
+        summary.fill(moves1, moves2)
+        return summary
+
+    @classmethod
+    def from_packed(cls, packed, rounds):
+        '''Summarizes a match from its moves packed by pack_moves().'''
+        summary = cls()
+        summary._fill(_unpack_nibbles(packed, rounds))
+        return summary
+
+    def fill(self, moves1, moves2):
+        '''Sets every field from both players' moves.'''
+        self._fill(_round_nibbles(moves1, moves2))
+
+    def _fill(self, nibbles):
+        # all of this is counting and searching bytes, none of it
+        # goes round by round in python
+        self.rounds = len(nibbles)
+        self.cc = nibbles.count(0)
+        self.cb = nibbles.count(1)
+        self.bc = nibbles.count(4)
+        self.bb = nibbles.count(5)
+        first1 = nibbles.translate(_NIBBLE_MOVES1).find(b'b')
+        first2 = nibbles.translate(_NIBBLE_MOVES2).find(b'b')
+        self.first_betrayal1 = first1 if first1 >= 0 else None
+        self.first_betrayal2 = first2 if first2 >= 0 else None
+        runs = nibbles.translate(_MUTUAL_COLLUSION).split()
+        self.longest_collusion = max(len(run) for run in runs) if runs else 0
+
+    def counts(self):
+        '''(cc, cb, bc, bb), as Payoffs.score() takes them.'''
+        return (self.cc, self.cb, self.bc, self.bb)
+
+    def score(self, payoffs=None):
+        '''Both players' total scores under payoffs (the current ones
+        by default).'''
+        return (payoffs if payoffs is not None else _payoffs).score(self.counts())
+
+    def swapped(self):
+        '''The same match seen from player2's side.'''
+        return MatchSummary(self.rounds, self.cc, self.bc, self.cb, self.bb,
+                            self.first_betrayal2, self.first_betrayal1,
+                            self.longest_collusion)
+
+    def __eq__(self, other):
+        return isinstance(other, MatchSummary) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'MatchSummary(%s)' % ', '.join(
+            '%s=%r' % (name, getattr(self, name)) for name in self.__slots__)
+
+def _summarized(result):
+    # a play_pairing() result with its packed moves swapped for a summary
+    # (None for analytic results, which have no moves)
+    player1, player2, score1, score2, rounds, packed = result
+    summary = MatchSummary.from_packed(packed, rounds) if rounds else None
+    return (player1, player2, score1, score2, rounds, summary)
+
+def play_pairing(pairing, seed=None, repetition=0, noise=None,
+                 summarize=False):
+    '''
+    Plays one pairing, given as a (player1, player2) tuple, and returns the
+    compact result (player1, player2, score1, score2, rounds, packed_moves)
+    that the tournament engine sends back from worker processes.
+    With a seed the pairing gets its own pairing_rng() stream.
+    A (player1, player2, rounds) tuple plays that many rounds (None for
+    the usual random number), and a (player1, player2, rounds, noise)
+    tuple plays with that Noise instead of the noise argument.
+    summarize=True sends back a MatchSummary in place of the packed moves,
+    for when the moves themselves aren't needed.
+    '''
+    player1, player2 = pairing[:2]
+    number_of_rounds = pairing[2] if len(pairing) > 2 else None
+    if len(pairing) > 3:
+        noise = pairing[3]
+    if _sandbox is not None:
+        _sandbox.start_match()
+    summary = MatchSummary() if summarize else None
+    moves1, moves2, score1, score2 = play_iterative_rounds(
+        player1, player2, pairing_rng(seed, player1, player2, repetition),
+        number_of_rounds, noise, summary)
+    if summarize:
+        return (player1, player2, score1, score2, len(moves1), summary)
+    return (player1, player2, score1, score2, len(moves1),
+            pack_moves(moves1, moves2))
+
+def play_machine_matches(machines1, machines2, rounds):
+    '''
+    Plays many StateMachine matches at once with numpy, one array element
+    per match: machines1[i] plays machines2[i] for rounds[i] rounds.
+    Returns (moves1, moves2, scores1, scores2), where the moves are
+    (matches x longest match) arrays holding 0 for collude and 1 for
+    betray (and 0 past the end of a shorter match), and the scores are
+    arrays of each match's total.
+    '''
+    if np is None:
+        raise ImportError('the vectorized engine needs numpy')
+    # stack every distinct machine into one big transition table
+    offsets = {}
+    actions = []
+    transitions = []
+    for machine in list(machines1) + list(machines2):
+        if id(machine) not in offsets:
+            offsets[id(machine)] = len(actions)
+            actions.extend(action == 'b' for action in machine.actions)
+            transitions.extend([len(actions) - len(machine) + state
+                                for state in pair]
+                               for pair in machine.transitions)
+    actions = np.array(actions, dtype=np.intp)
+    transitions = np.array(transitions, dtype=np.intp).reshape(-1, 2)
+    payoffs = np.array(_payoffs.matrix, dtype=np.int64)
+
+    rounds = np.asarray(rounds, dtype=np.intp)
+    state1 = np.array([offsets[id(machine)] + machine.start
+                       for machine in machines1], dtype=np.intp)
+    state2 = np.array([offsets[id(machine)] + machine.start
+                       for machine in machines2], dtype=np.intp)
+    longest = int(rounds.max()) if len(rounds) else 0
+    moves1 = np.zeros((len(rounds), longest), dtype=np.uint8)
+    moves2 = np.zeros((len(rounds), longest), dtype=np.uint8)
+    scores1 = np.zeros(len(rounds), dtype=np.int64)
+    scores2 = np.zeros(len(rounds), dtype=np.int64)
+    for round in range(longest):
+        playing = rounds > round
+        action1 = actions[state1] * playing
+        action2 = actions[state2] * playing
+        moves1[:, round] = action1
+        moves2[:, round] = action2
+        scores1 += payoffs[action1, action2] * playing
+        scores2 += payoffs[action2, action1] * playing
+        # each machine moves on according to what its opponent just did
+        state1 = transitions[state1, action2]
+        state2 = transitions[state2, action1]
+    return moves1, moves2, scores1, scores2
+
+def play_machine_pairings(pairings, seed=None, repetition=0):
+    '''
+    Plays pairings between strategies that all have state machines in one
+    batch with play_machine_matches(), returning a list of the same compact
+    results as play_pairing(). The number of rounds of each pairing comes
+    from its pairing_rng(), so seeded results match the python engine.
+    '''
+    if not pairings:
+        return []
+    rounds = [pairing_rng(seed, player1, player2,
+                          repetition).randint(*_match_lengths)
+              for player1, player2 in pairings]
+    moves1, moves2, scores1, scores2 = play_machine_matches(
+        [lookup_strategy(player1).machine for player1, player2 in pairings],
+        [lookup_strategy(player2).machine for player1, player2 in pairings],
+        rounds)
+    # pack the moves the same way pack_moves() does: a nibble per round,
+    # two rounds per byte
+    nibbles = moves1 * 4 + moves2
+    if nibbles.shape[1] % 2:
+        nibbles = np.pad(nibbles, ((0, 0), (0, 1)), 'constant')
+    packed = nibbles[:, 0::2] * 16 + nibbles[:, 1::2]
+    return [(player1, player2, int(scores1[i]), int(scores2[i]), rounds[i],
+             packed[i, :(rounds[i] + 1) // 2].tobytes())
+            for i, (player1, player2) in enumerate(pairings)]
+
+def markov_chain(strategy):
+    '''
+    Describes a strategy as a Markov chain for expected_pairing(), or
+    returns None if it can't be: (start, colluding, next_state), where
+    colluding[state] is the probability of colluding in that state and
+    next_state[state][own][opponent's] is the state after a round, with
+    0 for collude and 1 for betray. StateMachines are chains that always
+    collude or always betray; declared memory-one strategies have a state
+    for the first round and one for each outcome of the last round.
+    Chains are all tuples, so equal chains can share expected results.
+    '''
+    if strategy.machine is not None:
+        machine = strategy.machine
+        colluding = tuple(1.0 if action == 'c' else 0.0
+                          for action in machine.actions)
+        next_state = tuple((pair, pair) for pair in machine.transitions)
+        return machine.start, colluding, next_state
+    if strategy.memory_one is not None:
+        # the same states as lookup_table()
+        after = ((1, 2), (3, 4))
+        return 0, tuple(strategy.memory_one), (after,) * 5
+    return None
+
+def expected_pairing(player1, player2, min_rounds=None, max_rounds=None):
+    '''
+    Works out the exact expected score per round of each player when the
+    match lasts a uniformly random number of rounds between min_rounds and
+    max_rounds (by default the current match_lengths()), like
+    play_iterative_rounds() does, with no sampling at all.
+    Both strategies need a markov_chain(). Two StateMachines go round a
+    cycle of pairs of states, which is summed in closed form; otherwise
+    the distribution over pairs of states is pushed through the joint
+    transition matrix (see _expected_chains()). Results are remembered
+    for each pair of chains, so strategies that share a chain are only
+    worked out once. Returns (score1 per round, score2 per round).
+    '''
+    chain1 = markov_chain(lookup_strategy(player1))
+    chain2 = markov_chain(lookup_strategy(player2))
+    if chain1 is None or chain2 is None:
+        raise ValueError('players %r and %r are not both memory-one or state '
+                         'machines' % (player1, player2))
+    if min_rounds is None:
+        min_rounds = _match_lengths[0]
+    if max_rounds is None:
+        max_rounds = _match_lengths[1]
+    return _expected_chains(chain1, chain2, min_rounds, max_rounds,
+                            _payoffs.matrix)
+
+def _average_scores(totals, min_rounds, max_rounds):
+    # the average over the match lengths of the score per round, from
+    # totals[length] = the expected score after that many rounds
+    lengths = max_rounds - min_rounds + 1
+    return sum(totals[length] / length
+               for length in range(min_rounds, max_rounds + 1)) / lengths
+
+@functools.lru_cache(maxsize=None)
+def _expected_chains(chain1, chain2, min_rounds, max_rounds, payoffs):
+    start1, colluding1, next1 = chain1
+    start2, colluding2, next2 = chain2
+    if all(colluding in (0.0, 1.0) for colluding in colluding1 + colluding2):
+        return _expected_cycle(chain1, chain2, min_rounds, max_rounds, payoffs)
+    if np is not None:
+        return _expected_matrix(chain1, chain2, min_rounds, max_rounds, payoffs)
+    # without numpy, the distribution is kept sparse and stepped through
+    # one round at a time; it only ever has as many entries as there are
+    # reachable pairs of states
+    distribution = {(start1, start2): 1.0}
+    totals1 = [0.0]
+    totals2 = [0.0]
+    for round in range(max_rounds):
+        following = {}
+        score1 = score2 = 0.0
+        for (state1, state2), probability in distribution.items():
+            move1 = (colluding1[state1], 1 - colluding1[state1])
+            move2 = (colluding2[state2], 1 - colluding2[state2])
+            for action1 in (0, 1):
+                for action2 in (0, 1):
+                    chance = probability * move1[action1] * move2[action2]
+                    if not chance:
+                        continue
+                    score1 += chance * payoffs[action1][action2]
+                    score2 += chance * payoffs[action2][action1]
+                    states = (next1[state1][action1][action2],
+                              next2[state2][action2][action1])
+                    following[states] = following.get(states, 0.0) + chance
+        distribution = following
+        totals1.append(totals1[-1] + score1)
+        totals2.append(totals2[-1] + score2)
+    return (_average_scores(totals1, min_rounds, max_rounds),
+            _average_scores(totals2, min_rounds, max_rounds))
+
+def _expected_cycle(chain1, chain2, min_rounds, max_rounds, payoffs):
+    # two deterministic chains visit one pair of states per round, and
+    # after at most len(states1) * len(states2) rounds they come back to a
+    # pair they have been in, so the match is a lead-in and then a cycle
+    # round and round; the total after any length follows from their sums
+    start1, colluding1, next1 = chain1
+    start2, colluding2, next2 = chain2
+    seen = {}
+    totals1 = [0.0]
+    totals2 = [0.0]
+    states = (start1, start2)
+    while states not in seen and len(seen) < max_rounds:
+        seen[states] = len(seen)
+        state1, state2 = states
+        action1 = 0 if colluding1[state1] else 1
+        action2 = 0 if colluding2[state2] else 1
+        totals1.append(totals1[-1] + payoffs[action1][action2])
+        totals2.append(totals2[-1] + payoffs[action2][action1])
+        states = (next1[state1][action1][action2],
+                  next2[state2][action2][action1])
+    averages = []
+    for totals in (totals1, totals2):
+        if states in seen:
+            lead = seen[states]
+            period = len(seen) - lead
+            cycle = totals[lead + period] - totals[lead]
+            for length in range(len(totals), max_rounds + 1):
+                cycles, part = divmod(length - lead, period)
+                totals.append(totals[lead + part] + cycles * cycle)
+        averages.append(_average_scores(totals, min_rounds, max_rounds))
+    return tuple(averages)
+
+def _expected_matrix(chain1, chain2, min_rounds, max_rounds, payoffs):
+    # the pair of states (state1, state2) is joint state
+    # state1 * len(states2) + state2; transitions[joint, following] is the
+    # chance of going from one to the other in a round, and rewards1/2
+    # the expected score of each player in a round played from it
+    start1, colluding1, next1 = chain1
+    start2, colluding2, next2 = chain2
+    size1 = len(colluding1)
+    size2 = len(colluding2)
+    transitions = np.zeros((size1 * size2, size1 * size2))
+    rewards1 = np.zeros(size1 * size2)
+    rewards2 = np.zeros(size1 * size2)
+    for state1 in range(size1):
+        move1 = (colluding1[state1], 1 - colluding1[state1])
+        for state2 in range(size2):
+            move2 = (colluding2[state2], 1 - colluding2[state2])
+            joint = state1 * size2 + state2
+            for action1 in (0, 1):
+                for action2 in (0, 1):
+                    chance = move1[action1] * move2[action2]
+                    rewards1[joint] += chance * payoffs[action1][action2]
+                    rewards2[joint] += chance * payoffs[action2][action1]
+                    following = (next1[state1][action1][action2] * size2 +
+                                 next2[state2][action2][action1])
+                    transitions[joint, following] += chance
+    # the distributions before every round, found by doubling: the rows
+    # for rounds [k, 2k) are the rows for [0, k) times transitions ** k
+    distributions = np.zeros((1, size1 * size2))
+    distributions[0, start1 * size2 + start2] = 1.0
+    power = transitions
+    while len(distributions) < max_rounds:
+        distributions = np.vstack((distributions, distributions.dot(power)))
+        power = power.dot(power)
+    distributions = distributions[:max_rounds]
+    # totals[length] is the expected score after that many rounds
+    lengths = np.arange(min_rounds, max_rounds + 1)
+    averages = []
+    for rewards in (rewards1, rewards2):
+        totals = np.concatenate(([0.0], np.cumsum(distributions.dot(rewards))))
+        averages.append(float(np.mean(totals[lengths] / lengths)))
+    return tuple(averages)
+
+def _analytic_result(pairing):
+    player1, player2 = pairing
+    score1, score2 = expected_pairing(player1, player2)
+    return player1, player2, score1, score2, 0, b''
+
+def play_analytic_pairings(pairings, workers=1, chunksize=None):
+    '''
+    Works out pairings between memory-one strategies and state machines
+    with expected_pairing(), returning results shaped like play_pairing()'s
+    but with rounds=0 and no moves: the scores are already the exact
+    expected scores per round (see scores_per_round()).
+    Like play_pairings(), workers other than 1 spreads them over a pool
+    of processes (None means one per CPU).
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(pairings) <= 1:
+        return [_analytic_result(pairing) for pairing in pairings]
+    if chunksize is None:
+        chunksize = max(1, len(pairings) // (workers * 4))
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(False, None, loaded_plugins(), _payoffs,
+                                       _match_lengths)) as pool:
+        return list(pool.map(_analytic_result, pairings, chunksize=chunksize))
+
+def scores_per_round(score1, score2, rounds):
+    '''The scores per round of a play_pairing() result, or of an analytic
+    one, which has rounds=0 and scores that already are per round.'''
+    if not rounds:
+        return score1, score2
+    return score1/rounds, score2/rounds
+
+def _init_worker(profile=False, sandbox=None, plugins=(), payoffs=None,
+                 lengths=None):
+    global _profiler, _sandbox, _payoffs, _match_lengths
+    # workers that were started fresh rather than forked need the
+    # plugin strategies loaded again, under the same ids
+    load_plugins(plugins)
+    # forked workers start with a copy of the parent's random state,
+    # so reseed or every worker would play the same "random" moves
+    random.seed()
+    _profiler = StrategyProfiler() if profile else None
+    if payoffs is not None:
+        _payoffs = payoffs
+    if lengths is not None:
+        _match_lengths = lengths
+    # the worker keeps its sandbox (and its timer) until it exits
+    _sandbox = sandbox
+    if sandbox is not None:
+        sandbox.arm()
+
+class PairingCache(object):
+    '''
+    On-disk cache of pairing results, kept in an sqlite database so reruns
+    of a tournament only replay the pairings whose strategies changed.
+    Results are keyed by pairing_cache_key(); once there are more than
+    max_entries results the least recently used ones are thrown out, which
+    is checked every evict_interval new results as well as on close().
+    Use it as a context manager, or call close() to save it.
+    '''
+    def __init__(self, filename, max_entries=1000000, evict_interval=1000):
+        import sqlite3
+        self.filename = filename
+        self.max_entries = max_entries
+        self.evict_interval = evict_interval
+        self._puts = 0
+        self._db = sqlite3.connect(filename)
+        self._db.execute('CREATE TABLE IF NOT EXISTS results ('
+                         'key TEXT PRIMARY KEY, score1 INTEGER, score2 INTEGER,'
+                         ' rounds INTEGER, moves BLOB, used INTEGER)')
+        self._clock = self._db.execute(
+            'SELECT COALESCE(MAX(used), 0) FROM results').fetchone()[0]
+
+    def get(self, key):
+        '''Returns the cached (score1, score2, rounds, packed_moves)
+        for key, or None.'''
+        row = self._db.execute('SELECT score1, score2, rounds, moves '
+                               'FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self._clock += 1
+        self._db.execute('UPDATE results SET used = ? WHERE key = ?',
+                         (self._clock, key))
+        return (row[0], row[1], row[2], bytes(row[3]))
+
+    def put(self, key, score1, score2, rounds, packed):
+        self._clock += 1
+        self._db.execute('INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?)',
+                         (key, score1, score2, rounds, packed, self._clock))
+        self._puts += 1
+        if self._puts >= self.evict_interval:
+            self._evict()
+
+    def _evict(self):
+        # throws out the least recently used results over max_entries
+        self._puts = 0
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            self._db.execute('DELETE FROM results WHERE key IN (SELECT key FROM '
+                             'results ORDER BY used LIMIT ?)', (excess,))
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        '''Evicts the least recently used results over max_entries
+        and saves the cache.'''
+        if self._db is None:
+            return
+        self._evict()
+        self._db.commit()
+        self._db.close()
+        self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# the parts of this file that a pairing's result depends on apart from the
+# strategies themselves: how rounds are played, scored and packed
+_ENGINE_CODE = ('Payoffs', 'MoveHistory', 'HistoryView', 'play_round',
+                'pairing_rng', 'play_machines', 'play_iterative_rounds',
+                'get_action', 'Strategy', '_call_strategy', '_round_nibbles',
+                'pack_moves', 'play_pairing')
+_engine_hash = None
+
+def _engine_digest():
+    # the source_digest() of the _ENGINE_CODE, so that editing one team
+    # in this file doesn't throw away every other team's cached results
+    global _engine_hash
+    if _engine_hash is None:
+        _engine_hash = source_digest(''.join(inspect.getsource(globals()[name])
+                                             for name in _ENGINE_CODE))
+    return _engine_hash
+
+def _plugin_hash(strategy):
+    # plugins are one strategy to a file, so they are keyed on the whole
+    # file, helpers and constants included; the built-in strategies all
+    # share this one and are keyed on their own function only
+    if strategy.function.__module__ == __name__:
+        return ''
+    return strategy.module_hash()
+
+def pairing_cache_key(player1, player2, rounds, seed=None, repetition=0):
+    '''
+    Returns the PairingCache key for a pairing of the given length, or None
+    if its result can't be cached. The key covers both strategies' source
+    code (the whole file, for plugins), the code in this file that plays
+    and scores the rounds, the number of rounds and the payoffs.
+    Strategies that make random choices are only cacheable in a seeded
+    tournament, and then the seed and the pairing itself are part of the
+    key too.
+    '''
+    strategy1 = _find_strategy(player1)
+    strategy2 = _find_strategy(player2)
+    if strategy1 is None or strategy2 is None:
+        return None
+    hashes = (strategy1.source_hash(), strategy2.source_hash(),
+              _plugin_hash(strategy1), _plugin_hash(strategy2),
+              _engine_digest())
+    if None in hashes:
+        return None
+    if strategy1.takes_rng or strategy2.takes_rng:
+        if seed is None:
+            return None
+        stream = (seed, player1, player2, repetition)
+    else:
+        stream = None
+    return hashlib.sha1(repr((hashes, rounds, _payoffs.matrix, stream))
+                        .encode('utf-8')).hexdigest()
 
+def play_pairings(pairings, workers=1, chunksize=None, seed=None, repetition=0,
+                  cache=None, profiler=None, sandbox=None, noise=None,
+                  summarize=False):
+    '''
+    Plays each (player1, player2) pairing and yields the play_pairing()
+    results in the same order as the pairings were given.
+    With workers=1 everything runs in this process; otherwise the pairings
+    are spread over a pool of that many worker processes (None means one
+    per CPU), handed out chunksize pairings at a time.
+    Given a seed, the results are the same whatever the number of workers.
+    Given a PairingCache, cached results are reused and only the other
+    pairings are played (and then added to the cache).
+    Given a StrategyProfiler, every strategy call is timed into it,
+    including the ones made in worker processes.
+    Given a Sandbox, strategies are held to its time budgets and its
+    violations include the ones from worker processes; sandboxed results
+    depend on timing (a move over budget is forfeited), so they are
+    never cached.
+    Given a Noise, every match is noisy; noisy results are never cached.
+    summarize=True yields MatchSummary objects in place of the packed
+    moves (see play_pairing()).
+    '''
+    if cache is not None and not noise and sandbox is None:
+        for result in _play_cached_pairings(pairings, workers, chunksize,
+                                            seed, repetition, cache, profiler):
+            # the cache keeps the moves, so summaries are made from them
+            yield _summarized(result) if summarize else result
+        return
+    play = functools.partial(play_pairing, seed=seed, repetition=repetition,
+                             noise=noise, summarize=summarize)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(pairings) <= 1:
+        if profiler is None and sandbox is None:
+            for pairing in pairings:
+                yield play(pairing)
+            return
+        with contextlib.ExitStack() as stack:
+            if profiler is not None:
+                stack.enter_context(profiling(profiler))
+            if sandbox is not None:
+                stack.enter_context(sandboxed(sandbox))
+            for pairing in pairings:
+                yield play(pairing)
+        return
+    if chunksize is None:
+        # a few chunks per worker keeps them all busy without much overhead
+        chunksize = max(1, len(pairings) // (workers * 4))
+    from concurrent.futures import ProcessPoolExecutor
+    reporting = profiler is not None or sandbox is not None
+    if reporting:
+        # each worker profiles and sandboxes on its own, and sends the
+        # counts back with every result
+        play = functools.partial(_play_reported_pairing, seed=seed,
+                                 repetition=repetition, noise=noise,
+                                 summarize=summarize)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(profiler is not None, sandbox,
+                                       loaded_plugins(), _payoffs,
+                                       _match_lengths)) as pool:
+        for result in pool.map(play, pairings, chunksize=chunksize):
+            if reporting:
+                result, profile, violations = result
+                if profiler is not None:
+                    profiler.merge(profile)
+                if sandbox is not None:
+                    sandbox.merge(violations)
+            yield result
+
+def _play_reported_pairing(pairing, seed=None, repetition=0, noise=None,
+                           summarize=False):
+    result = play_pairing(pairing, seed, repetition, noise, summarize)
+    return (result,
+            _profiler.snapshot() if _profiler is not None else None,
+            _sandbox.snapshot() if _sandbox is not None else None)
+
+def _play_cached_pairings(pairings, workers, chunksize, seed, repetition, cache,
+                          profiler):
+    # work out every pairing's length and cache key up front, so the
+    # cache is only ever touched from this process
+    cached = {}
+    keys = {}
+    to_play = []
+    for pairing in pairings:
+        player1, player2 = pairing
+        rng = pairing_rng(seed, player1, player2, repetition)
+        if seed is None and (_find_strategy(player1) is None or
+                             _find_strategy(player1).takes_rng or
+                             _find_strategy(player2) is None or
+                             _find_strategy(player2).takes_rng):
+            # unseeded random strategies are never cached, and drawing the
+            # number of rounds here would change their random stream
+            to_play.append(pairing)
+            continue
+        rounds = rng.randint(*_match_lengths)
+        key = pairing_cache_key(player1, player2, rounds, seed, repetition)
+        hit = cache.get(key) if key is not None else None
+        if hit is not None:
+            cached[pairing] = (player1, player2) + hit
+            continue
+        keys[pairing] = key
+        # a seeded pairing draws the same number of rounds again in the
+        # worker; an unseeded one has to be told it
+        to_play.append(pairing if seed is not None else (player1, player2, rounds))
+    played = play_pairings(to_play, workers, chunksize, seed, repetition,
+                           profiler=profiler)
+    for pairing in pairings:
+        if pairing in cached:
+            yield cached[pairing]
+            continue
+        result = next(played)
+        if keys.get(pairing) is not None:
+            cache.put(keys[pairing], *result[2:])
+        yield result
+
+class ResultMatrix(object):
+    '''
+    A size x size table of floats kept in one flat array, a lot smaller than
+    a list of lists for big fields. table[i][j] reads and writes like the
+    old lists of lists did, since each row is a memoryview into the array.
+    '''
+    __slots__ = ('size', 'values', '_view')
+
+    def __init__(self, size):
+        self.size = size
+        self.values = array.array('d', bytes(8 * size * size))
+        self._view = memoryview(self.values)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, row):
+        if not 0 <= row < self.size:
+            raise IndexError('row %r out of range' % (row,))
+        return self._view[row * self.size:(row + 1) * self.size]
+
+    def __iter__(self):
+        for row in range(self.size):
+            yield self[row]
+
+    def tolist(self):
+        return [list(row) for row in self]
+
+# where play_tournament() keeps the source code of what it played, see
+# SourceStore
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'sources')
+
+def source_digest(source):
+    '''The SHA-1 a SourceStore files source under, the same hash
+    Strategy.source_hash() gives a strategy's own source.'''
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+# filename -> (modification time, digest) of the files file_digest() has read
+_file_digests = {}
+
+def file_digest(filename):
+    '''The source_digest() of a whole file, the one SourceStore.put_file()
+    files it under. Files are only read again once they have changed.'''
+    modified = os.stat(filename).st_mtime_ns
+    known = _file_digests.get(filename)
+    if known is None or known[0] != modified:
+        with open(filename, encoding='utf-8', newline='') as source:
+            known = (modified, source_digest(source.read()))
+        _file_digests[filename] = known
+    return known[1]
+
+class SourceStore(object):
+    '''
+    A content-addressed store of source code: each distinct source is
+    kept once, in directory/<first 2 digits>/<other 38 digits> under its
+    source_digest(), however many tournaments refer to it. Files are
+    written under a temporary name and renamed into place, so a digest
+    that is there always has its whole source. Stores from different
+    machines can be merged by simply copying their files together.
+    '''
+    def __init__(self, directory=None):
+        self.directory = directory if directory is not None else SOURCE_DIRECTORY
+        # digests known to be stored already, so they aren't checked again
+        self._stored = set()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def __contains__(self, digest):
+        return digest in self._stored or os.path.exists(self._path(digest))
+
+    def put(self, source):
+        '''Stores source, if it isn't already, and returns its digest.'''
+        digest = source_digest(source)
+        if digest not in self:
+            path = self._path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.partial', 'w', encoding='utf-8', newline='') as stored:
+                stored.write(source)
+            os.replace(path + '.partial', path)
+        self._stored.add(digest)
+        return digest
+
+    def get(self, digest):
+        '''Returns the source stored under digest. Raises KeyError if
+        there is none.'''
+        try:
+            with open(self._path(digest), encoding='utf-8', newline='') as stored:
+                return stored.read()
+        except FileNotFoundError:
+            raise KeyError('no source %s in %s' % (digest, self.directory))
+
+    def put_file(self, filename):
+        with open(filename, encoding='utf-8', newline='') as source:
+            return self.put(source.read())
+
+def store_sources(field, store):
+    '''
+    Puts the source code of this file and of every strategy in the field
+    in store, a SourceStore, and returns what a report needs to refer to
+    them: {'directory', 'engine': this file's digest, 'strategies':
+    [[player, digest of its function, digest of the file it is in], ...]},
+    with None for any source that can't be found.
+    '''
+    engine = store.put_file(os.path.abspath(__file__))
+    strategies = []
+    for player in field:
+        function = lookup_strategy(player).function
+        try:
+            own = store.put(inspect.getsource(function))
+            module = store.put_file(inspect.getsourcefile(function))
+        except (OSError, TypeError):
+            own = module = None
+        strategies.append([player, own, module])
+    return {'directory': os.path.abspath(store.directory), 'engine': engine,
+            'strategies': strategies}
+
+def _source_digests(field):
+    # [engine, strategies] as store_sources() would record them for the
+    # field, without storing anything
+    strategies = []
+    for player in field:
+        strategy = lookup_strategy(player)
+        strategies.append([player, strategy.source_hash(),
+                           strategy.module_hash()])
+    return [file_digest(os.path.abspath(__file__)), strategies]
+
+class TournamentReport(object):
+    '''
+    Writes tournament.txt as the tournament is played: each pairing's
+    block goes out as soon as that pairing is finished, through one
+    buffered file that is flushed at least every flush_interval seconds,
+    so nothing has to hold on to every pairing's moves until the end.
+    log_moves=True writes every pairing's moves, False writes none and a
+    fraction like 0.1 writes the moves of evenly spread 10% of pairings.
+    team_names[i] is the name of field[i], the player id in the i-th row
+    and column of the tables (by default players 0, 1, 2...).
+    Use it as a context manager, or call close() when done.
+    '''
+    def __init__(self, filename, team_names, log_moves=True,
+                 buffer_size=1 << 16, flush_interval=1.0, field=None):
+        self._clock = time.time
+        self.team_names = team_names
+        if field is None:
+            field = range(len(team_names))
+        self.field = list(field)
+        self._names = dict(zip(self.field, team_names))
+        self.log_moves = log_moves
+        self.flush_interval = flush_interval
+        self._pairs = 0
+        self._last_flush = self._clock()
+        self._file = open(filename, 'w', buffering=buffer_size)
+
+    def _logging_moves(self):
+        # sampling keeps pairing n when n*rate crosses a whole number
+        if self.log_moves is True or self.log_moves is False:
+            return self.log_moves
+        return int((self._pairs + 1) * self.log_moves) > \
+            int(self._pairs * self.log_moves)
+
+    def write_pair(self, player1, player2, score1_per_round, score2_per_round,
+                   rounds, packed):
+        '''Writes one pairing's block; packed is the pairing's moves
+        from pack_moves(), only unpacked if they are being logged.
+        Analytic results (rounds=0) have no moves to write.'''
+        lines = [#title by team numbers
+                 'team ' + str(player1) + ' vs. ' + 'team ' + str(player2),
+                 #title by player-on-player average score
+                 str(score1_per_round) + ' vs. ' + str(score2_per_round),
+                 #title by team names
+                 self._names[player1] + ' vs. ' + self._names[player2]]
+        if rounds and self._logging_moves():
+            #show the moves, aligned vertically
+            lines.extend(unpack_moves(packed, rounds))
+        #blank line between each pair's results
+        lines.append('\n')
+        self._file.write('\n'.join(lines))
+        self._pairs += 1
+        if self._clock() - self._last_flush >= self.flush_interval:
+            self._file.flush()
+            self._last_flush = self._clock()
+
+    def write_summary(self, result_table, scores, sections=(), sources=None):
+        '''Writes the score table and totals at the bottom, then any extra
+        (title, lines) sections such as the strategy timings, followed by
+        where to find the code that produced them: sources is what
+        store_sources() returned, if the code was stored.'''
+        num_players = len(scores)
+        field = self.field
         #at the bottom repeat the output that was sent to the screen
         #print a title for the table
-        results.write('\n\n\n\tEach column shows score earned per round against each other player.\n\n\n')
+        lines = ['\n\n\n\tEach column shows score earned per round against each other player.\n\n\n']
         #print header line
-        results.write('\t') #skip 1st column
+        lines.append('\t') #skip 1st column
         for player1 in range(num_players):
-            results.write('P'+str(player1)+'\t') # label each additional column
-        results.write('\n')
+            lines.append('P'+str(field[player1])+'\t') # label each additional column
+        lines.append('\n')
 
         #print each player's scores
         for player2 in range(num_players):
-            results.write('P'+str(player2)+'\t') #label the player's row
+            lines.append('P'+str(field[player2])+'\t') #label the player's row
             for player1 in range(num_players):
                 #print score against each other player
-                results.write(str(result_table[player1][player2])+'\t')
-            results.write('\n')
-        results.write('Total:\t')
+                if player1 == player2:
+                    lines.append('0\t') # the unused diagonal
+                else:
+                    lines.append(str(result_table[player1][player2])+'\t')
+            lines.append('\n')
+        lines.append('Total:\t')
         for player1 in range(num_players):
-            results.write(str(int(scores[player1]))+'\t')
-        results.write('\n\n\n Average per round, with team strategy names:\n\n')
+            lines.append(str(int(scores[player1]))+'\t')
+        lines.append('\n\n\n Average per round, with team strategy names:\n\n')
 
         #print team ids, total scores, and names
         for player in range(num_players):
-            results.write('player ' + str(player) + ': ' + \
-                    str(int(scores[player])/num_players) + ' points: '+\
-                    team_names[player]+'\n')
+            lines.append('player ' + str(field[player]) + ': ' +
+                         str(int(scores[player])/num_players) + ' points: ' +
+                         self.team_names[player]+'\n')
+
+        for title, section_lines in sections:
+            lines.append('\n\n ' + title + ':\n\n')
+            lines.append('\n'.join(section_lines) + '\n')
+
+        #refer to the code showing algorithms, kept once in the source store
+        if sources is not None:
+            lines.append('\n\n' + '-'*79 + '\n' +
+                         'The code that produced this data is in the source '
+                         'store ' + sources['directory'] + ',\n'
+                         'under these SHA-1 digests (see SourceStore):\n\n')
+            lines.append('engine\t' + sources['engine'] + '\n\n')
+            lines.append('player\tstrategy\tfile\tname\n')
+            for player, own, module in sources['strategies']:
+                lines.append('%s\t%s\t%s\t%s\n' % (player, own or '-',
+                                                   module or '-',
+                                                   self._names[player]))
+        self._file.write(''.join(lines))
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# binary match log layout: a fixed header giving where the index is and how
+# many pairings it has, each pairing's packed moves back to back, then the
+# index with one (player1, player2, offset, rounds, score1, score2) entry per
+# pairing, sorted by (player1, player2) so one pairing can be found without
+# reading the rest. The scores are doubles, since payoffs needn't be whole
+# numbers; the first version of the format had them as int64
+_MATCH_LOG_MAGIC = b'PDMLOG02'
+_MATCH_LOG_HEADER = struct.Struct('<8sQQ')
+_MATCH_LOG_ENTRY = struct.Struct('<IIQIdd')
+_MATCH_LOG_ENTRIES = {_MATCH_LOG_MAGIC: _MATCH_LOG_ENTRY,
+                      b'PDMLOG01': struct.Struct('<IIQIqq')}
+
+class MatchLogWriter(object):
+    '''
+    Writes a binary match log: every pairing's total scores and its moves
+    packed 2 bits per player per round (see pack_moves()), with an index
+    that MatchLogReader uses to pull out single pairings.
+    Pairings are written as they finish; the index goes on the end when
+    the log is closed. Use it as a context manager, or call close().
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'wb')
+        self._file.write(_MATCH_LOG_HEADER.pack(_MATCH_LOG_MAGIC, 0, 0))
+        self._offset = _MATCH_LOG_HEADER.size
+        self._entries = []
+
+    def write_pair(self, player1, player2, score1, score2, rounds, packed):
+        self._file.write(packed)
+        self._entries.append((player1, player2, self._offset, rounds,
+                              score1, score2))
+        self._offset += len(packed)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._entries.sort()
+        index = bytearray()
+        for entry in self._entries:
+            index += _MATCH_LOG_ENTRY.pack(*entry)
+        self._file.write(index)
+        self._file.seek(0)
+        self._file.write(_MATCH_LOG_HEADER.pack(_MATCH_LOG_MAGIC, self._offset,
+                                                len(self._entries)))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class MatchLogReader(object):
+    '''
+    Reads a MatchLogWriter file through a memory map, so looking up one
+    pairing only touches its index entry (found by binary search) and its
+    own moves, however big the log is. Logs written before the scores
+    were doubles are read too.
+    '''
+    def __init__(self, filename):
+        import mmap
+        self.filename = filename
+        with open(filename, 'rb') as log:
+            self._map = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._index_offset, self._count = \
+            _MATCH_LOG_HEADER.unpack_from(self._map, 0)
+        if magic not in _MATCH_LOG_ENTRIES:
+            self._map.close()
+            raise ValueError('%s is not a match log' % filename)
+        self._entry_struct = _MATCH_LOG_ENTRIES[magic]
+
+    def __len__(self):
+        return self._count
+
+    def _entry(self, position):
+        return self._entry_struct.unpack_from(
+            self._map, self._index_offset + position * self._entry_struct.size)
+
+    def __iter__(self):
+        '''Yields every (player1, player2, offset, rounds, score1, score2)
+        index entry, in (player1, player2) order.'''
+        for position in range(self._count):
+            yield self._entry(position)
+
+    def entry(self, player1, player2):
+        '''Returns the index entry (player1, player2, offset, rounds,
+        score1, score2) for a pairing, or None if it isn't in the log.'''
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            if entry[:2] < (player1, player2):
+                low = middle + 1
+            elif entry[:2] > (player1, player2):
+                high = middle
+            else:
+                return entry
+        return None
+
+    def moves(self, player1, player2):
+        '''Returns the (moves1, moves2) strings of a pairing, with moves1
+        being player1's, whichever way round it was stored.'''
+        entry = self.entry(player1, player2)
+        swapped = entry is None
+        if swapped:
+            entry = self.entry(player2, player1)
+            if entry is None:
+                raise KeyError('no pairing of %r and %r in %s'
+                               % (player1, player2, self.filename))
+        offset, rounds = entry[2], entry[3]
+        moves1, moves2 = unpack_moves(self._map[offset:offset + (rounds + 1) // 2],
+                                      rounds)
+        if swapped:
+            return moves2, moves1
+        return moves1, moves2
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# the ways pairings can be played, see play_field_pairings()
+ENGINES = ('python', 'vectorized', 'analytic')
+
+def play_field_pairings(pairings, workers=1, chunksize=None, seed=None,
+                        engine='python', cache=None, profiler=None,
+                        sandbox=None, repetition=0, noise=None,
+                        summarize=False):
+    '''
+    Plays pairings with the given engine, yielding play_pairing() results
+    in the same order as pairings (with summaries in place of the moves
+    if summarize is true). With engine='vectorized', those between
+    two state machines are played in one numpy batch first, and with
+    engine='analytic', those between memory-one strategies and state
+    machines are worked out exactly by play_analytic_pairings(); the rest
+    go through play_pairings(). Noisy pairings always go through
+    play_pairings(), since neither shortcut holds with noise.
+    '''
+    if engine not in ENGINES:
+        raise ValueError('unknown engine %r' % (engine,))
+    if noise:
+        engine = 'python'
+    if engine == 'analytic':
+        exact = [(player1, player2) for player1, player2 in pairings
+                 if markov_chain(lookup_strategy(player1)) is not None and
+                 markov_chain(lookup_strategy(player2)) is not None]
+        batched = dict(((result[0], result[1]), result)
+                       for result in play_analytic_pairings(exact, workers,
+                                                            chunksize))
+    elif engine == 'vectorized':
+        batched = [(player1, player2) for player1, player2 in pairings
+                   if lookup_strategy(player1).machine is not None and
+                   lookup_strategy(player2).machine is not None]
+        batched = dict(((result[0], result[1]), result)
+                       for result in play_machine_pairings(batched, seed,
+                                                           repetition))
+    else:
+        batched = {}
+    played = play_pairings([pairing for pairing in pairings
+                            if pairing not in batched],
+                           workers, chunksize, seed, repetition, cache=cache,
+                           profiler=profiler, sandbox=sandbox, noise=noise,
+                           summarize=summarize)
+    for pairing in pairings:
+        if pairing in batched:
+            yield _summarized(batched[pairing]) if summarize else batched[pairing]
+        else:
+            yield next(played)
+
+def _tournament_field(num_players):
+    # (field, team_names) for a number of players 0..num_players-1 or a
+    # list of player ids and strategy names (see load_field()); players
+    # that aren't registered raise KeyError here, not halfway through
+    if isinstance(num_players, int):
+        field = load_field(range(num_players))
+    else:
+        field = load_field(num_players)
+    # get the team name from each team algorithm
+    team_names = [get_action(player,'','',0,0,getting_team_name=True)
+                  for player in field]
+    return field, team_names
+
+def _tournament_setup(num_players, engine, profile, move_budget, match_budget,
+                      payoffs):
+    # the checks and bits and pieces play_tournament() and play_shard()
+    # both start with: (field, team_names, payoffs, profiler, sandbox)
+    if payoffs is None:
+        payoffs = _payoffs
+    elif not isinstance(payoffs, Payoffs):
+        payoffs = Payoffs(*payoffs)
+    if engine not in ENGINES:
+        raise ValueError('unknown engine %r' % (engine,))
+    profiler = StrategyProfiler() if profile else None
+    if move_budget is not None or match_budget is not None:
+        sandbox = Sandbox(move_budget, match_budget)
+    else:
+        sandbox = None
+    field, team_names = _tournament_field(num_players)
+    return field, team_names, payoffs, profiler, sandbox
+
+def play_tournament(num_players, workers=1, chunksize=None, seed=None,
+                    engine='python', cache=None, log_moves=True,
+                    match_log=None, datafile='tournament.txt', profile=False,
+                    move_budget=None, match_budget=None, noise=None,
+                    payoffs=None, journal=None, resume=False, export=(),
+                    sources=SOURCE_DIRECTORY):
+    '''
+    Plays every team against every other team, reports the results
+    on screen and in tournament.txt and returns (result_table, scores).
+    num_players can also be the field itself, a list of player ids and
+    strategy names (see load_field()), so plugin strategies are imported
+    only if they are playing.
+    workers and chunksize are passed on to play_pairings(), so
+    workers=None plays the pairings on every CPU.
+    Giving a seed makes the whole tournament reproducible.
+    With engine='vectorized', pairings between two strategies that have
+    state machines are all played at once with numpy and the rest are
+    played as usual. With engine='analytic', pairings between memory-one
+    strategies and state machines score their exact expected values
+    instead of one random match's (see expected_pairing()).
+    cache is a PairingCache, or the filename of one, to reuse pairing
+    results from earlier runs.
+    log_moves says which pairings' moves go in tournament.txt
+    (see TournamentReport).
+    match_log is the filename of a binary MatchLogWriter log to write too.
+    datafile names the text report, next to this file unless it's an
+    absolute path; None skips writing it.
+    profile=True times every strategy's decisions (see StrategyProfiler)
+    and adds the timings to both reports.
+    move_budget and match_budget are CPU time limits in seconds for one
+    decision and for one strategy's whole pairing (see Sandbox); any
+    strategy that breaks them is listed in both reports.
+    noise is a Noise to play every match with.
+    payoffs is the Payoffs to score the rounds with, instead of the
+    usual ones (or a (release, treat, severe_punishment, punishment)
+    tuple of them).
+    journal is the filename of a TournamentJournal to record every
+    finished pairing in as it goes, and resume=True carries on with the
+    tournament in it, only playing the pairings it doesn't have yet.
+    The same settings (and a seed) make a resumed tournament come out
+    the same as one that was never interrupted; strategy timings and
+    violations only cover the pairings played this time.
+    export is a list of .csv and .npz files to write the results to as
+    well, in columns (see export_results()).
+    sources is the directory of the SourceStore that the code of this
+    file and of every strategy playing is kept in, tournament.txt
+    referring to it by digest; None keeps no code.
+    '''
+    if resume and journal is None:
+        raise ValueError('resume=True needs the journal to resume')
+    field, team_names, payoffs, profiler, sandbox = _tournament_setup(
+        num_players, engine, profile, move_budget, match_budget, payoffs)
+    num_players = len(field)
+
+    # play a game between every player and every other player of lower number
+    pairings = [(field[player1], field[player2]) for player1 in range(num_players)
+                for player2 in range(player1)]
+    opened_cache = isinstance(cache, str)
+    if opened_cache:
+        cache = PairingCache(cache)
+    # results come back in pairing order, so the tables and the score
+    # sums are the same however many workers played them; workers only
+    # send the moves back if they are going to be written out (the exported
+    # match statistics come from the moves too, and a journal only has
+    # them to resume with if it kept them)
+    needs_moves = (datafile is not None and log_moves is not False or
+                   match_log is not None or bool(export))
+    if sources is not None:
+        sources = store_sources(field, SourceStore(sources))
+    try:
+        if journal is not None:
+            journal = TournamentJournal(journal, _tournament_settings(
+                field, team_names, seed, engine, noise, payoffs, needs_moves,
+                sources), resume)
+            # the journal has the first len(journal) pairings already
+            pairings = pairings[len(journal):]
+        results = play_field_pairings(pairings, workers, chunksize, seed, engine,
+                                      cache, profiler, sandbox, noise=noise,
+                                      summarize=not needs_moves)
+        if journal is not None:
+            results = journal.record(results)
+        return _report_tournament(field, team_names, results, payoffs,
+                                  log_moves, match_log, datafile, profiler,
+                                  sandbox, export, sources)
+    finally:
+        if isinstance(journal, TournamentJournal):
+            journal.close()
+        if opened_cache:
+            cache.close()
+
+def _report_tournament(field, team_names, results, payoffs=None, log_moves=True,
+                       match_log=None, datafile='tournament.txt', profiler=None,
+                       sandbox=None, export=(), sources=None):
+    # fills in the tables from play_pairing() results in pairing order,
+    # writing the reports as they come in, and shows the totals on screen;
+    # play_tournament() and merge_shards() both end this way
+    if payoffs is None:
+        payoffs = _payoffs
+    num_players = len(field)
+    # where each player id is in the tables
+    position = dict((player, index) for index, player in enumerate(field))
+    names_by_player = dict(zip(field, team_names))
+
+    #create a list of zeros, one per player
+    scores = array.array('d', bytes(8 * num_players))
 
+    # each row will become a column for each player, and the unused
+    # diagonal starts off (and stays) 0
+    result_table = ResultMatrix(num_players)
 
-        #append the file showing algorithms
-        results.write('\n\n' + '-'*79 + '\n' + \
-                    'Here is the code that produced this data:\n\n')
-        this_code_file = open(__file__, 'r')
-        for line in this_code_file:
-            results.write(line)
+    '''report round-level results in a data file as they come in'''
+    use_datafile = datafile is not None
+    if use_datafile:
+        # use the same directory as the python script
+        import os.path
+        directory = os.path.dirname(os.path.abspath(__file__))
+
+        #name the file tournament.txt
+        filename = os.path.join(directory, datafile)
+        #create the file for the round-by-round results
+        report = TournamentReport(filename, team_names, log_moves, field=field)
+    else:
+        report = None
+    binary_log = MatchLogWriter(match_log) if match_log is not None else None
+    pairing_columns = PairingColumns() if export else None
+
+    try:
+        with scoring(payoffs):
+            for player1, player2, score1, score2, rounds, packed in results:
+                score1_per_round, score2_per_round = scores_per_round(score1, score2,
+                                                                      rounds)
+
+                row1 = position[player1]
+                row2 = position[player2]
+                result_table[row1][row2]=score1_per_round
+                result_table[row2][row1]=score2_per_round
+
+                #accumulate the results for the two players
+                scores[row1] += score1_per_round#ends up same as column sum
+                scores[row2] += score2_per_round#ends up same as column sum
+
+                if report is not None:
+                    report.write_pair(player1, player2, score1_per_round,
+                                      score2_per_round, rounds, packed)
+                # analytic results have no moves or whole scores to log
+                if binary_log is not None and rounds:
+                    binary_log.write_pair(player1, player2, score1, score2,
+                                          rounds, packed)
+                if pairing_columns is not None:
+                    pairing_columns.add(player1, player2, score1_per_round,
+                                        score2_per_round, rounds, packed)
+        sections = []
+        if profiler is not None:
+            sections.append(('Time spent deciding, by strategy',
+                             profiler.report_lines(names_by_player)))
+        if sandbox is not None and sandbox.violations:
+            sections.append(('Strategies that ran out of time or crashed',
+                             sandbox.report_lines(names_by_player)))
+        if report is not None:
+            report.write_summary(result_table, scores, sections, sources)
+        for filename in export:
+            export_results(filename, field, team_names, result_table, scores,
+                           pairing_columns)
+    finally:
+        if report is not None:
+            report.close()
+        if binary_log is not None:
+            binary_log.close()
 
     '''report the results on screen'''
     #print a title for the table
@@ -810,12 +2934,12 @@ def play_tournament(num_players):
     #print header line
     print('\t', end='') #skip 1st column
     for player1 in range(num_players):
-        print('P',player1, end='\t') # label each additional column
+        print('P',field[player1], end='\t') # label each additional column
     print()
 
     #print each player's scores
     for player2 in range(num_players):
-        print('P',player2, end='\t') #label the player's row
+        print('P',field[player2], end='\t') #label the player's row
         for player1 in range(num_players):
             #print score against each other player
             print("{:.2f}".format(result_table[player1][player2]), end='\t')
@@ -828,16 +2952,1304 @@ def play_tournament(num_players):
     print('\n\n\n Average per round, with team strategy names:\n\n')
     #print team ids, total scores, and names
     for player in range(num_players):
-        print('player ' + str(player) , ': ' ,
+        print('player ' + str(field[player]) , ': ' ,
                str("{:.2f}".format((scores[player])/num_players)) , ' points: ',
                team_names[player])
-def main():
-    howmanyteams=int(input("How many teams do you want to run in this tournament? Max:20  "))
+
+    for title, section_lines in sections:
+        print('\n\n ' + title + ':\n')
+        for line in section_lines:
+            print(line)
+    return result_table, scores
+
+# the per-pairing columns export_results() writes, with their array
+# typecodes; counts that aren't known (analytic results, or results whose
+# moves weren't kept) and betrayals that never happened are -1
+_PAIRING_COLUMNS = (('player1', 'q'), ('player2', 'q'),
+                    ('score1_per_round', 'd'), ('score2_per_round', 'd'),
+                    ('rounds', 'q'), ('cc', 'q'), ('cb', 'q'), ('bc', 'q'),
+                    ('bb', 'q'), ('first_betrayal1', 'q'),
+                    ('first_betrayal2', 'q'), ('longest_collusion', 'q'))
+
+class PairingColumns(object):
+    '''
+    A tournament's pairings kept as columns, one typed array per
+    _PAIRING_COLUMNS entry with a row per pairing, so export_results()
+    can write each one in bulk. The match statistics come from each
+    pairing's MatchSummary, or from its packed moves.
+    '''
+    def __init__(self):
+        self.columns = [(name, array.array(code)) for name, code in _PAIRING_COLUMNS]
+
+    def __len__(self):
+        return len(self.columns[0][1])
+
+    def add(self, player1, player2, score1_per_round, score2_per_round, rounds,
+            packed):
+        if isinstance(packed, MatchSummary):
+            summary = packed
+        elif rounds and packed:
+            summary = MatchSummary.from_packed(packed, rounds)
+        else:
+            summary = None
+        if summary is None:
+            statistics = (-1, -1, -1, -1, -1, -1, -1)
+        else:
+            statistics = summary.counts() + (
+                -1 if summary.first_betrayal1 is None else summary.first_betrayal1,
+                -1 if summary.first_betrayal2 is None else summary.first_betrayal2,
+                summary.longest_collusion)
+        row = (player1, player2, score1_per_round, score2_per_round,
+               rounds) + statistics
+        for (name, column), value in zip(self.columns, row):
+            column.append(value)
+
+def export_results(filename, field, team_names, result_table, scores, pairings):
+    '''
+    Writes a tournament's results in columns, for loading in one go
+    rather than parsing tournament.txt. pairings is a PairingColumns.
+    A .npz file (which needs numpy) holds every pairing column as an
+    array, plus field, team_names, scores and the whole result_table.
+    A .csv file gets a row per pairing, and a -teams.csv file next to it
+    gets a row per team with its position, player id, name, total score
+    and average per round.
+    '''
+    stem, extension = os.path.splitext(filename)
+    num_players = len(field)
+    if extension == '.npz':
+        if np is None:
+            raise ImportError('exporting to .npz needs numpy')
+        arrays = dict((name, np.frombuffer(column, dtype=column.typecode))
+                      for name, column in pairings.columns)
+        np.savez(filename, field=np.array(field, dtype=np.int64),
+                 team_names=np.array(team_names),
+                 scores=np.frombuffer(scores, dtype=np.float64),
+                 result_table=np.frombuffer(result_table.values, dtype=np.float64)
+                 .reshape(num_players, num_players), **arrays)
+    elif extension == '.csv':
+        import csv
+        with open(filename, 'w', newline='') as export:
+            writer = csv.writer(export)
+            writer.writerow([name for name, column in pairings.columns])
+            writer.writerows(zip(*[column for name, column in pairings.columns]))
+        with open(stem + '-teams.csv', 'w', newline='') as export:
+            writer = csv.writer(export)
+            writer.writerow(['position', 'player', 'team_name', 'score',
+                             'average_per_round'])
+            writer.writerows((position, field[position], team_names[position],
+                              scores[position], scores[position] / num_players)
+                             for position in range(num_players))
+    else:
+        raise ValueError('can only export to .npz or .csv, not %r' % (filename,))
+
+def shard_bounds(num_players, shard, shards):
+    '''
+    The pairings in shard number shard (from 0) of shards, as a range of
+    positions in play_tournament()'s list of pairings: the triangle of
+    num_players * (num_players - 1) / 2 pairings cut into shards runs of
+    consecutive pairings whose lengths differ by at most one.
+    '''
+    if not 0 <= shard < shards:
+        raise ValueError('there is no shard %r of %r' % (shard, shards))
+    total = num_players * (num_players - 1) // 2
+    return range(total * shard // shards, total * (shard + 1) // shards)
+
+def shard_pairings(field, shard, shards):
+    '''The (player1, player2) pairings of the field in shard of shards
+    (see shard_bounds()), in the order play_tournament() plays them.'''
+    positions = shard_bounds(len(field), shard, shards)
+    # row player1 of the triangle starts at position player1*(player1-1)/2
+    start = positions.start
+    player1 = int((1 + math.sqrt(1 + 8 * start)) / 2)
+    while player1 * (player1 - 1) // 2 > start:
+        player1 -= 1
+    while (player1 + 1) * player1 // 2 <= start:
+        player1 += 1
+    player2 = start - player1 * (player1 - 1) // 2
+    pairings = []
+    for position in positions:
+        pairings.append((field[player1], field[player2]))
+        player2 += 1
+        if player2 == player1:
+            player1 += 1
+            player2 = 0
+    return pairings
+
+def shard_filename(shard, shards, directory=''):
+    '''Where play_sharded_tournament() keeps shard of shards.'''
+    return os.path.join(directory, 'tournament-%d-of-%d.shard' % (shard, shards))
+
+# shard file layout: a fixed header giving where the trailer is and how long
+# the JSON settings after it are, then one record per pairing followed by
+# its packed moves (if the shard keeps them), then the JSON trailer with
+# the shard's profile and sandbox violations
+_SHARD_MAGIC = b'PDSHARD1'
+_SHARD_HEADER = struct.Struct('<8sQI')
+_SHARD_RECORD = struct.Struct('<IIddII')
+
+class ShardWriter(object):
+    '''
+    Writes one shard's results, in pairing order, to a partial result file
+    for merge_shards(). settings describes the tournament, so that shards
+    of different tournaments can't be merged by mistake. The file is
+    written under a temporary name and only renamed into place by close(),
+    so a shard that died part way never leaves a file that looks finished;
+    abort() throws the partial file away instead.
+    '''
+    def __init__(self, filename, settings, keep_moves=True):
+        import json
+        self.filename = filename
+        self.keep_moves = keep_moves
+        self._temporary = filename + '.partial'
+        self._file = open(self._temporary, 'wb')
+        encoded = json.dumps(settings).encode('utf-8')
+        self._settings_length = len(encoded)
+        self._file.write(_SHARD_HEADER.pack(_SHARD_MAGIC, 0, len(encoded)))
+        self._file.write(encoded)
+        self._offset = _SHARD_HEADER.size + len(encoded)
+
+    def write_pair(self, player1, player2, score1, score2, rounds, packed):
+        packed = packed if self.keep_moves and rounds else b''
+        self._file.write(_SHARD_RECORD.pack(player1, player2, score1, score2,
+                                            rounds, len(packed)))
+        self._file.write(packed)
+        self._offset += _SHARD_RECORD.size + len(packed)
+
+    def close(self, profiler=None, sandbox=None):
+        '''Adds the profile and violations, if any, and puts the file in place.'''
+        import json
+        if self._file.closed:
+            return
+        trailer = {'profile': [], 'violations': []}
+        if profiler is not None:
+            stats, last_errors = profiler.snapshot()
+            trailer['profile'] = [
+                [player, calls, seconds, errors, sorted(buckets.items()),
+                 last_errors.get(player)]
+                for player, (calls, seconds, errors, buckets) in sorted(stats.items())]
+        if sandbox is not None:
+            trailer['violations'] = [
+                [player, kind, count, message] for (player, kind), (count, message)
+                in sorted(sandbox.snapshot().items())]
+        self._file.write(json.dumps(trailer).encode('utf-8'))
+        self._file.seek(0)
+        self._file.write(_SHARD_HEADER.pack(_SHARD_MAGIC, self._offset,
+                                            self._settings_length))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._temporary, self.filename)
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._temporary)
+
+class ShardReader(object):
+    '''
+    Reads a ShardWriter file: settings is the tournament it belongs to,
+    iterating over it gives its play_pairing() results in pairing order
+    (with packed moves, or b'' if the shard didn't keep them), and
+    profiler and sandbox hold its strategy timings and violations.
+    '''
+    def __init__(self, filename):
+        import json
+        self.filename = filename
+        with open(filename, 'rb') as shard:
+            magic, self._trailer_offset, length = \
+                _SHARD_HEADER.unpack(shard.read(_SHARD_HEADER.size))
+            if magic != _SHARD_MAGIC:
+                raise ValueError('%s is not a shard file' % filename)
+            self.settings = json.loads(shard.read(length).decode('utf-8'))
+            self._records_offset = shard.tell()
+            shard.seek(self._trailer_offset)
+            trailer = json.loads(shard.read().decode('utf-8'))
+        self.profiler = StrategyProfiler()
+        for player, calls, seconds, errors, buckets, last_error in trailer['profile']:
+            self.profiler.stats[player] = [calls, seconds, errors, dict(buckets)]
+            if last_error is not None:
+                self.profiler.last_errors[player] = last_error
+        self.sandbox = Sandbox()
+        for player, kind, count, message in trailer['violations']:
+            self.sandbox.violations[player, kind] = [count, message]
+
+    def __len__(self):
+        return self.settings['pairings']
+
+    def __iter__(self):
+        with open(self.filename, 'rb') as shard:
+            shard.seek(self._records_offset)
+            for number in range(len(self)):
+                record = _SHARD_RECORD.unpack(shard.read(_SHARD_RECORD.size))
+                yield _stored_result(record, shard.read(record[5]))
+
+def _stored_result(record, packed):
+    # a play_pairing() result back from a _SHARD_RECORD and its moves
+    player1, player2, score1, score2, rounds, length = record
+    if rounds and score1.is_integer() and score2.is_integer():
+        # played matches have whole scores, unless the payoffs aren't
+        score1, score2 = int(score1), int(score2)
+    return (player1, player2, score1, score2, rounds, packed)
+
+def _tournament_settings(field, team_names, seed, engine, noise, payoffs,
+                         keep_moves, sources=None):
+    # what a shard or journal records about its tournament, as JSON; the
+    # source digests make sure the code didn't change in between either
+    return {'field': field, 'team_names': team_names, 'seed': seed,
+            'engine': engine, 'rounds': list(_match_lengths),
+            'payoffs': [payoffs.release, payoffs.treat,
+                        payoffs.severe_punishment, payoffs.punishment],
+            'noise': [noise.mistake_rate, noise.observation_rate] if noise else None,
+            'moves': bool(keep_moves), 'sources': sources}
+
+def play_shard(num_players, shard, shards, filename=None, workers=1,
+               chunksize=None, seed=None, engine='python', cache=None,
+               keep_moves=True, profile=False, move_budget=None,
+               match_budget=None, noise=None, payoffs=None,
+               sources=SOURCE_DIRECTORY):
+    '''
+    Plays only shard (from 0) of shards of a tournament's pairings (see
+    shard_pairings()) and saves the results to filename (by default
+    shard_filename()) for merge_shards() to put back together, returning
+    the filename. Each shard is independent, so they can be played by
+    separate processes or on separate machines, as long as every one is
+    given the same field and settings; a seed is needed for the merged
+    tournament to be the same as play_tournament()'s.
+    keep_moves=False leaves the moves out, which makes the file far
+    smaller but means the merged reports can't show them.
+    The other arguments are the same as play_tournament()'s.
+    '''
+    field, team_names, payoffs, profiler, sandbox = _tournament_setup(
+        num_players, engine, profile, move_budget, match_budget, payoffs)
+    pairings = shard_pairings(field, shard, shards)
+    if filename is None:
+        filename = shard_filename(shard, shards)
+    if sources is not None:
+        sources = store_sources(field, SourceStore(sources))
+    settings = _tournament_settings(field, team_names, seed, engine, noise,
+                                    payoffs, keep_moves, sources)
+    settings.update(shard=shard, shards=shards, pairings=len(pairings))
+    opened_cache = isinstance(cache, str)
+    if opened_cache:
+        cache = PairingCache(cache)
+    writer = ShardWriter(filename, settings, keep_moves)
+    try:
+        with scoring(payoffs):
+            for result in play_field_pairings(pairings, workers, chunksize, seed,
+                                              engine, cache, profiler, sandbox,
+                                              noise=noise,
+                                              summarize=not keep_moves):
+                writer.write_pair(*result)
+        writer.close(profiler, sandbox)
+    finally:
+        # does nothing once the shard is closed, only if it failed
+        writer.abort()
+        if opened_cache:
+            cache.close()
+    return filename
+
+def merge_shards(filenames, log_moves=True, match_log=None,
+                 datafile='tournament.txt', export=()):
+    '''
+    Puts a tournament back together from the files of all its shards
+    (see play_shard()), in any order, and reports it on screen, in
+    tournament.txt, in match_log and in the export files just like
+    play_tournament() would, with the shards' strategy timings and
+    violations added up.
+    Returns (result_table, scores).
+    Raises ValueError if the files aren't all the shards of one tournament,
+    or if moves are to be written out and the shards didn't keep them.
+    '''
+    shards = sorted((ShardReader(filename) for filename in filenames),
+                    key=lambda shard: shard.settings['shard'])
+    if not shards:
+        raise ValueError('there are no shards to merge')
+    settings = dict(shards[0].settings)
+    count = settings['shards']
+    numbers = [shard.settings['shard'] for shard in shards]
+    if numbers != list(range(count)):
+        missing = sorted(set(range(count)) - set(numbers))
+        raise ValueError('need each of the %d shards once; missing %s, got %s'
+                         % (count, missing, numbers))
+    def code(settings):
+        # shards played on different machines keep their code in different
+        # stores, but it has to be the same code
+        sources = settings['sources']
+        return sources and (sources['engine'], sources['strategies'])
+    for shard in shards:
+        other = dict(shard.settings)
+        if any(other[key] != settings[key] for key in settings
+               if key not in ('shard', 'pairings', 'sources')) or \
+                code(other) != code(settings):
+            raise ValueError('%s is a shard of a different tournament'
+                             % shard.filename)
+        if len(shard) != len(shard_bounds(len(settings['field']),
+                                          other['shard'], count)):
+            raise ValueError('%s has the wrong number of pairings'
+                             % shard.filename)
+    needs_moves = (datafile is not None and log_moves is not False or
+                   match_log is not None or bool(export))
+    if needs_moves and not settings['moves']:
+        raise ValueError('the shards were played without keeping the moves, '
+                         'so use log_moves=False, no match_log and no export')
+    profiler = sandbox = None
+    for shard in shards:
+        if shard.profiler.stats:
+            profiler = profiler or StrategyProfiler()
+            profiler.merge(shard.profiler)
+        if shard.sandbox.violations:
+            sandbox = sandbox or Sandbox()
+            sandbox.merge(shard.sandbox.violations)
+    results = (result for shard in shards for result in shard)
+    return _report_tournament(settings['field'], settings['team_names'], results,
+                              Payoffs(*settings['payoffs']), log_moves,
+                              match_log, datafile, profiler, sandbox, export,
+                              settings['sources'])
+
+def _reusable_shard(filename, expected, code):
+    # whether a shard file that is already there was played with the
+    # expected settings and the code with the digests in code (None for
+    # none kept), so that it needn't be played again
+    try:
+        settings = ShardReader(filename).settings
+    except (OSError, ValueError, KeyError, struct.error):
+        return False
+    sources = settings.get('sources')
+    return (all(settings.get(key) == value for key, value in expected.items())
+            and (sources and [sources['engine'], sources['strategies']]) == code)
+
+def _play_numbered_shard(num_players, shard, shards, filename, settings):
+    # play_shard() in a launcher worker, which plays one shard at a time
+    return play_shard(num_players, shard, shards, filename, **settings)
+
+def play_sharded_tournament(num_players, shards, directory='shards',
+                            processes=None, log_moves=True, match_log=None,
+                            datafile='tournament.txt', export=(), **settings):
+    '''
+    Plays a tournament as shards independent play_shard() jobs on this
+    machine, up to processes of them (None means one per CPU) at a time,
+    each in a worker process of its own, then reports it with
+    merge_shards() and returns (result_table, scores).
+    The shard files are kept in directory and a shard whose file is
+    already there isn't played again, as long as it was played with the
+    same field, settings and code, so after a failure rerunning the
+    same call only plays the shards that failed (shards of any other
+    tournament are played over); raises RuntimeError, after the others
+    have finished, if any shard did.
+    settings are play_shard()'s other arguments, apart from workers,
+    since each shard gets one process; a seed keeps the results the same
+    whichever shards get replayed.
+    '''
+    import json
+    # load any plugins here, so the workers get them under the same ids
+    field, team_names = _tournament_field(num_players)
+    # the exported match statistics come from the moves too
+    settings.setdefault('keep_moves', datafile is not None and log_moves is not False
+                        or match_log is not None or bool(export))
+    payoffs = settings.get('payoffs')
+    if payoffs is None:
+        payoffs = _payoffs
+    elif not isinstance(payoffs, Payoffs):
+        payoffs = Payoffs(*payoffs)
+    # what the shards of this tournament record, as it comes back from JSON
+    expected = json.loads(json.dumps(_tournament_settings(
+        field, team_names, settings.get('seed'), settings.get('engine', 'python'),
+        settings.get('noise') or None, payoffs, settings['keep_moves'])))
+    expected['shards'] = shards
+    # the code is compared by digest, wherever it was stored
+    del expected['sources']
+    if settings.get('sources', SOURCE_DIRECTORY) is not None:
+        code = _source_digests(field)
+    else:
+        code = None
+    os.makedirs(directory, exist_ok=True)
+    filenames = [shard_filename(shard, shards, directory) for shard in range(shards)]
+    missing = [shard for shard in range(shards)
+               if not _reusable_shard(filenames[shard], expected, code)]
+    failed = {}
+    if missing:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count() or 1,
+                                 initializer=_init_worker,
+                                 initargs=(False, None, loaded_plugins(),
+                                           _payoffs, _match_lengths)) as pool:
+            jobs = dict((shard, pool.submit(_play_numbered_shard, field, shard,
+                                            shards, filenames[shard], settings))
+                        for shard in missing)
+            for shard, job in sorted(jobs.items()):
+                try:
+                    job.result()
+                except Exception as error:
+                    failed[shard] = error
+    if failed:
+        raise RuntimeError('shards %s failed: %s' % (
+            sorted(failed), '; '.join('%d: %r' % item for item in sorted(failed.items()))))
+    return merge_shards(filenames, log_moves, match_log, datafile, export)
+
+# journal layout: the magic, the length of the JSON settings, the settings
+# and their CRC32, then one record per finished pairing: a CRC32 of the
+# rest of the record, a _SHARD_RECORD and the pairing's packed moves
+_JOURNAL_MAGIC = b'PDJRNL01'
+_JOURNAL_HEADER = struct.Struct('<8sI')
+_JOURNAL_CRC = struct.Struct('<I')
+
+class TournamentJournal(object):
+    '''
+    An append-only journal of a tournament's finished pairings, so that an
+    interrupted play_tournament() can carry on where it stopped instead of
+    starting again. Each pairing goes in as one CRC-checked record in a
+    single write, and the file is flushed and fsynced at least every
+    sync_interval seconds, so a crash loses at most that much work.
+    Results arrive in pairing order, so the finished pairings are always
+    the first len(journal) of the tournament; a torn or corrupt record
+    at the end (one that was still being written) is cut off on resume,
+    and that pairing is played again.
+    settings describes the tournament, and resuming a journal of a
+    different tournament raises ValueError. Without resume, or if the
+    file isn't there yet, a new journal is started.
+    Use it as a context manager, or call close().
+    '''
+    def __init__(self, filename, settings, resume=False, sync_interval=2.0):
+        import json
+        self._clock = time.time
+        self.filename = filename
+        self.sync_interval = sync_interval
+        self.settings = settings
+        self.finished = 0
+        encoded = json.dumps(settings).encode('utf-8')
+        if resume and os.path.exists(filename):
+            end = self._scan(encoded)
+            self._file = open(filename, 'r+b')
+            # anything after the last good record never finished
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            # the header goes in place whole, so a journal always has one
+            with open(filename + '.partial', 'wb') as journal:
+                journal.write(_JOURNAL_HEADER.pack(_JOURNAL_MAGIC, len(encoded)))
+                journal.write(encoded)
+                journal.write(_JOURNAL_CRC.pack(zlib.crc32(encoded)))
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(filename + '.partial', filename)
+            self._records_offset = (_JOURNAL_HEADER.size + len(encoded) +
+                                    _JOURNAL_CRC.size)
+            self._file = open(filename, 'ab')
+        self._last_sync = self._clock()
+
+    def _scan(self, encoded):
+        # checks the header and counts the good records, returning where
+        # the last one ends
+        with open(self.filename, 'rb') as journal:
+            head = journal.read(_JOURNAL_HEADER.size)
+            if len(head) < _JOURNAL_HEADER.size or \
+                    _JOURNAL_HEADER.unpack(head)[0] != _JOURNAL_MAGIC:
+                raise ValueError('%s is not a tournament journal' % self.filename)
+            length = _JOURNAL_HEADER.unpack(head)[1]
+            stored = journal.read(length)
+            crc = journal.read(_JOURNAL_CRC.size)
+            if len(crc) < _JOURNAL_CRC.size or \
+                    _JOURNAL_CRC.unpack(crc)[0] != zlib.crc32(stored):
+                raise ValueError('the header of %s is corrupt' % self.filename)
+            if stored != encoded:
+                raise ValueError('%s is the journal of a different tournament'
+                                 % self.filename)
+            self._records_offset = end = journal.tell()
+            size = _JOURNAL_CRC.size + _SHARD_RECORD.size
+            while True:
+                head = journal.read(size)
+                if len(head) < size:
+                    return end
+                record = _SHARD_RECORD.unpack_from(head, _JOURNAL_CRC.size)
+                packed = journal.read(record[5])
+                crc, = _JOURNAL_CRC.unpack_from(head)
+                if len(packed) < record[5] or \
+                        crc != zlib.crc32(packed, zlib.crc32(head[_JOURNAL_CRC.size:])):
+                    return end
+                self.finished += 1
+                end = journal.tell()
+
+    def __len__(self):
+        return self.finished
+
+    def replay(self):
+        '''Yields the finished pairings' results, in pairing order.'''
+        with open(self.filename, 'rb') as journal:
+            journal.seek(self._records_offset)
+            for number in range(self.finished):
+                journal.seek(_JOURNAL_CRC.size, os.SEEK_CUR)
+                record = _SHARD_RECORD.unpack(journal.read(_SHARD_RECORD.size))
+                yield _stored_result(record, journal.read(record[5]))
+
+    def write_pair(self, player1, player2, score1, score2, rounds, packed):
+        packed = packed if self.settings['moves'] and rounds else b''
+        record = _SHARD_RECORD.pack(player1, player2, score1, score2, rounds,
+                                    len(packed))
+        self._file.write(_JOURNAL_CRC.pack(zlib.crc32(packed, zlib.crc32(record))) +
+                         record + packed)
+        self.finished += 1
+        if self._clock() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        '''Makes sure everything written so far is on disk.'''
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = self._clock()
+
+    def record(self, results):
+        '''
+        Yields the results of the whole tournament: first the finished
+        pairings' from the journal, then results, the play_pairing()
+        results of the rest, journalling each one.
+        '''
+        for result in self.replay():
+            yield result
+        for result in results:
+            self.write_pair(*result)
+            yield result
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _normal_quantile(probability):
+    # the inverse of the normal distribution's CDF, found by bisection
+    # to stay on the standard library
+    low, high = -40.0, 40.0
+    for step in range(100):
+        middle = (low + high) / 2
+        if (1 + math.erf(middle / math.sqrt(2))) / 2 < probability:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+def _add_sample(means, squares, sample, count):
+    # Welford's running mean and sum of squared differences, in place
+    for index, value in enumerate(sample):
+        difference = value - means[index]
+        means[index] += difference / count
+        squares[index] += difference * (value - means[index])
+
+class TournamentStatistics(object):
+    '''
+    Running means and confidence intervals of every cell of result_table
+    and every total in scores over repeated tournaments of one field.
+    result_table and scores hold the means so far, laid out like the
+    tables of a single tournament; add() takes one more tournament's.
+    The intervals use the normal approximation at the given confidence.
+    '''
+    def __init__(self, field, team_names, confidence=0.95):
+        self.field = list(field)
+        self.team_names = team_names
+        self.confidence = confidence
+        self.repetitions = 0
+        self.result_table = ResultMatrix(len(self.field))
+        self.scores = array.array('d', bytes(8 * len(self.field)))
+        self._table_squares = array.array('d', bytes(8 * len(self.field) ** 2))
+        self._score_squares = array.array('d', bytes(8 * len(self.field)))
+        self._z = _normal_quantile((1 + confidence) / 2)
+
+    def add(self, result_table, scores):
+        '''result_table is flat, row after row, or a ResultMatrix.'''
+        if isinstance(result_table, ResultMatrix):
+            result_table = result_table.values
+        self.repetitions += 1
+        _add_sample(self.result_table.values, self._table_squares,
+                    result_table, self.repetitions)
+        _add_sample(self.scores, self._score_squares, scores,
+                    self.repetitions)
+
+    def _half_width(self, squares):
+        if self.repetitions < 2:
+            return float('inf')
+        variance = squares / (self.repetitions - 1)
+        return self._z * math.sqrt(variance / self.repetitions)
+
+    def table_interval(self, row, column):
+        '''Half the width of the interval around result_table[row][column].'''
+        return self._half_width(
+            self._table_squares[row * len(self.field) + column])
+
+    def score_interval(self, player):
+        '''Half the width of the interval around scores[player].'''
+        return self._half_width(self._score_squares[player])
+
+    def ranking(self):
+        '''Table positions from the highest mean score to the lowest.'''
+        return sorted(range(len(self.field)), key=lambda player: -self.scores[player])
+
+    def stable(self, tolerance=1.0):
+        '''
+        True once no two neighbours in the ranking could swap places: their
+        intervals don't overlap, or both are narrower than tolerance so
+        they are known to be tied to within tolerance. tolerance is in
+        average points per round, like the final scores on screen.
+        '''
+        if self.repetitions < 2:
+            return False
+        tolerance *= len(self.field)
+        ranking = self.ranking()
+        for higher, lower in zip(ranking, ranking[1:]):
+            higher_width = self.score_interval(higher)
+            lower_width = self.score_interval(lower)
+            if self.scores[higher] - higher_width > self.scores[lower] + lower_width:
+                continue
+            if higher_width > tolerance or lower_width > tolerance:
+                return False
+        return True
+
+def _play_repetition(field, seed, repetition, engine):
+    # one whole tournament, returning its flat result table and scores
+    num_players = len(field)
+    position = dict((player, index) for index, player in enumerate(field))
+    result_table = array.array('d', bytes(8 * num_players * num_players))
+    scores = array.array('d', bytes(8 * num_players))
+    pairings = [(field[player1], field[player2]) for player1 in range(num_players)
+                for player2 in range(player1)]
+    for player1, player2, score1, score2, rounds, summary in play_field_pairings(
+            pairings, seed=seed, engine=engine, repetition=repetition,
+            summarize=True):
+        score1, score2 = scores_per_round(score1, score2, rounds)
+        row1 = position[player1]
+        row2 = position[player2]
+        result_table[row1 * num_players + row2] = score1
+        result_table[row2 * num_players + row1] = score2
+        scores[row1] += score1
+        scores[row2] += score2
+    return result_table, scores
+
+def repeated_tournaments(field, repetitions, workers=1, seed=None,
+                         engine='python'):
+    '''
+    Yields (result_table, scores) for repetitions tournaments of the field
+    in order, result_table being flat, row after row. Tournament r plays
+    with repetition=r, so seeded runs are reproducible and every
+    tournament is different. With more than one worker the tournaments
+    are spread over that many processes (None means one per CPU), a
+    couple per worker at a time, so closing the generator early
+    cancels the ones not started yet.
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for repetition in range(repetitions):
+            yield _play_repetition(field, seed, repetition, engine)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(False, None, loaded_plugins(),
+                                       _payoffs, _match_lengths)) as pool:
+        pending = []
+        submitted = 0
+        try:
+            while submitted < repetitions or pending:
+                while submitted < repetitions and len(pending) < workers * 2:
+                    pending.append(pool.submit(_play_repetition, field, seed,
+                                               submitted, engine))
+                    submitted += 1
+                yield pending.pop(0).result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+def play_repeated_tournaments(num_players, repetitions=100, min_repetitions=10,
+                              confidence=0.95, tolerance=1.0, workers=1,
+                              seed=None, engine='python', progress=True):
+    '''
+    Plays up to repetitions tournaments of the same field and reports the
+    mean of every result and score on screen, each with its confidence
+    interval. It stops early, after at least min_repetitions, once the
+    ranking is stable (see TournamentStatistics.stable()). progress=True
+    prints the running leader and the widest score interval after each
+    tournament. num_players, workers, seed and engine work like they do
+    for play_tournament(). Returns the TournamentStatistics.
+    '''
+    if engine not in ENGINES:
+        raise ValueError('unknown engine %r' % (engine,))
+    field, team_names = _tournament_field(num_players)
+    num_players = len(field)
+    statistics = TournamentStatistics(field, team_names, confidence)
+
+    results = repeated_tournaments(field, repetitions, workers, seed, engine)
+    try:
+        for result_table, scores in results:
+            statistics.add(result_table, scores)
+            stable = (statistics.repetitions >= min_repetitions and
+                      statistics.stable(tolerance))
+            if progress:
+                leader = statistics.ranking()[0]
+                widest = max(statistics.score_interval(player)
+                             for player in range(num_players))
+                print('tournament %d: P %s leads with %.2f, scores within +/- %.2f%s'
+                      % (statistics.repetitions, field[leader],
+                         statistics.scores[leader] / num_players,
+                         widest / num_players, ', ranking stable' if stable else ''))
+            if stable:
+                break
+    finally:
+        results.close()
+
+    '''report the results on screen'''
+    print('\n\n\tMean score earned per round against each other player over %d tournaments,'
+          % statistics.repetitions)
+    print('\twith the half width of each %g%% confidence interval below it.\n\n'
+          % (confidence * 100))
+    print('\t', end='')
+    for player1 in range(num_players):
+        print('P',field[player1], end='\t')
+    print()
+    for player2 in range(num_players):
+        print('P',field[player2], end='\t')
+        for player1 in range(num_players):
+            print("{:.2f}".format(statistics.result_table[player1][player2]), end='\t')
+        print()
+        print('', end='\t')
+        for player1 in range(num_players):
+            if player1 == player2:
+                print('', end='\t')
+            else:
+                print("+/-{:.2f}".format(statistics.table_interval(player1, player2)),
+                      end='\t')
+        print()
+    print('Total:\t',end='')
+    for player1 in range(num_players):
+        print("{:.2f}".format(statistics.scores[player1]),end='\t')
+    print()
+
+    print('\n\n\n Average per round, with team strategy names:\n\n')
+    for player in statistics.ranking():
+        print('player ' + str(field[player]) , ': ' ,
+              "{:.2f}".format(statistics.scores[player]/num_players) ,
+              "+/- {:.2f}".format(statistics.score_interval(player)/num_players) ,
+              ' points: ', team_names[player])
+    return statistics
+
+def play_noise_sweep(num_players, levels=(0.0, 0.01, 0.02, 0.05, 0.1),
+                     kind='mistake', workers=1, chunksize=None, seed=None):
+    '''
+    Plays the field once at each noise level and shows every team's average
+    score per round at each level on screen. levels are Noise objects, or
+    rates of the given kind of noise: 'mistake', 'observation' or 'both'.
+    The pairings of every level go through a single play_pairings() call,
+    so a pool of workers is started (and plugins loaded) once for the whole
+    sweep. With a seed, a pairing lasts the same number of rounds at every
+    level, so the levels only differ in their noise.
+    Returns {noise: scores}, scores being in the order of the field.
+    '''
+    if kind not in ('mistake', 'observation', 'both'):
+        raise ValueError('unknown kind of noise %r' % (kind,))
+    grid = []
+    for level in levels:
+        if not isinstance(level, Noise):
+            level = Noise(level if kind != 'observation' else 0.0,
+                          level if kind != 'mistake' else 0.0)
+        grid.append(level)
+    field, team_names = _tournament_field(num_players)
+    num_players = len(field)
+    position = dict((player, index) for index, player in enumerate(field))
+    pairings = [(field[player1], field[player2], None, noise)
+                for noise in grid for player1 in range(num_players)
+                for player2 in range(player1)]
+    played = play_pairings(pairings, workers, chunksize, seed, summarize=True)
+    sweep = dict((noise, array.array('d', bytes(8 * num_players)))
+                 for noise in grid)
+    for pairing, result in zip(pairings, played):
+        player1, player2, score1, score2, rounds, summary = result
+        scores = sweep[pairing[3]]
+        scores[position[player1]] += score1/rounds/num_players
+        scores[position[player2]] += score2/rounds/num_players
+
+    '''report the results on screen'''
+    print('\n\n\tAverage score per round at each level of noise.\n\n')
+    print('\t', end='')
+    for noise in grid:
+        print('%g/%g' % (noise.mistake_rate, noise.observation_rate), end='\t')
+    print(' (mistake/observation rates)')
+    for player in range(num_players):
+        print('P',field[player], end='\t')
+        for noise in grid:
+            print("{:.2f}".format(sweep[noise][player]), end='\t')
+        print(team_names[player])
+    return sweep
+
+def play_payoff_study(num_players, payoff_sets, workers=1, chunksize=None,
+                      seed=None, engine='python'):
+    '''
+    Plays the field once and scores the same matches under every Payoffs
+    in payoff_sets (or (release, treat, severe_punishment, punishment)
+    tuples), from how many rounds of each pairing ended each way (see
+    MatchSummary), instead of replaying the tournament for each one.
+    That gives the same results as replaying it because strategies don't
+    look at the scores. Only a MatchSummary per pairing comes back from
+    the workers, not its moves. Shows every team's average score per round
+    under each set of payoffs on screen and returns a list of
+    (payoffs, result_table, scores), tables being laid out like
+    play_tournament()'s.
+    '''
+    if engine == 'analytic':
+        raise ValueError('analytic results have no moves to score again')
+    payoff_sets = [payoffs if isinstance(payoffs, Payoffs) else Payoffs(*payoffs)
+                   for payoffs in payoff_sets]
+    field, team_names = _tournament_field(num_players)
+    num_players = len(field)
+    position = dict((player, index) for index, player in enumerate(field))
+    pairings = [(field[player1], field[player2]) for player1 in range(num_players)
+                for player2 in range(player1)]
+    studies = [(payoffs, ResultMatrix(num_players),
+                array.array('d', bytes(8 * num_players)))
+               for payoffs in payoff_sets]
+    for player1, player2, score1, score2, rounds, summary in play_field_pairings(
+            pairings, workers, chunksize, seed, engine, summarize=True):
+        counts = summary.counts()
+        row1 = position[player1]
+        row2 = position[player2]
+        for payoffs, result_table, scores in studies:
+            score1, score2 = payoffs.score(counts)
+            result_table[row1][row2] = score1/rounds
+            result_table[row2][row1] = score2/rounds
+            scores[row1] += score1/rounds
+            scores[row2] += score2/rounds
+
+    '''report the results on screen'''
+    print('\n\n\tAverage score per round under each set of payoffs.\n\n')
+    print('\t', end='')
+    for payoffs in payoff_sets:
+        print('%r/%r/%r/%r' % (payoffs.treat, payoffs.release,
+                               payoffs.punishment, payoffs.severe_punishment),
+              end='\t')
+    print(' (T/R/P/S)')
+    for player in range(num_players):
+        print('P',field[player], end='\t')
+        for payoffs, result_table, scores in studies:
+            print("{:.2f}".format(scores[player]/num_players), end='\t')
+        print(team_names[player])
+    return studies
+
+def payoff_matrix(num_players, workers=1, chunksize=None, seed=None,
+                  engine='python', cache=None):
+    '''
+    Plays every pairing of the field once, each team against itself
+    included, and returns (field, payoffs): payoffs[i, j] is the score per
+    round field[i] earned against field[j], as a numpy array. Population
+    dynamics only need this matrix, so the matches are played once rather
+    than every generation. num_players is a number of teams or a field,
+    like in play_tournament(), and the other arguments are passed on to
+    play_field_pairings().
+    '''
+    if np is None:
+        raise ImportError('the evolutionary simulations need numpy')
+    field, team_names = _tournament_field(num_players)
+    position = dict((player, index) for index, player in enumerate(field))
+    pairings = [(field[player1], field[player2])
+                for player1 in range(len(field)) for player2 in range(player1 + 1)]
+    payoffs = np.zeros((len(field), len(field)))
+    opened_cache = isinstance(cache, str)
+    if opened_cache:
+        cache = PairingCache(cache)
+    try:
+        for player1, player2, score1, score2, rounds, summary in play_field_pairings(
+                pairings, workers, chunksize, seed, engine, cache,
+                summarize=True):
+            score1, score2 = scores_per_round(score1, score2, rounds)
+            row1 = position[player1]
+            row2 = position[player2]
+            if row1 == row2:
+                # a team playing itself earns the average of both sides
+                payoffs[row1, row1] = (score1 + score2) / 2
+            else:
+                payoffs[row1, row2] = score1
+                payoffs[row2, row1] = score2
+    finally:
+        if opened_cache:
+            cache.close()
+    return field, payoffs
+
+_SMALLEST_SHARE = 2.2250738585072014e-308 # the smallest normal float
+
+def _fitness_offset(payoffs, background):
+    # fitness has to be positive, so every payoff is shifted up until the
+    # worst one is worth the background fitness
+    return background - payoffs.min()
+
+def replicator_dynamics(payoffs, generations=1000, population=None,
+                        background=1.0):
+    '''
+    Discrete replicator dynamics: each generation every strategy's share of
+    an infinite population grows in proportion to its fitness, the payoff
+    it expects against the current population. population holds the
+    starting shares (equal by default), or one row of shares for each of
+    several populations to run side by side. Returns an array of the
+    shares after each generation, the starting ones first.
+    '''
+    payoffs = np.asarray(payoffs, dtype=float)
+    fitness_matrix = payoffs + _fitness_offset(payoffs, background)
+    if population is None:
+        population = np.ones(len(payoffs))
+    shares = np.array(population, dtype=float)
+    shares /= shares.sum(axis=-1, keepdims=True)
+    history = np.empty((generations + 1,) + shares.shape)
+    history[0] = shares
+    for generation in range(1, generations + 1):
+        fitness = shares @ fitness_matrix.T
+        shares = shares * fitness
+        shares /= shares.sum(axis=-1, keepdims=True)
+        # strategies dying out would otherwise end up as denormal floats,
+        # which are very slow to multiply
+        shares[shares < _SMALLEST_SHARE] = 0
+        history[generation] = shares
+    return history
+
+def moran_process(payoffs, generations=1000, population_size=100,
+                  population=None, runs=1, seed=None, background=1.0):
+    '''
+    The Moran process on a finite population of population_size players.
+    At each step one player, picked in proportion to fitness (its payoff
+    against everyone else in the population), has a child that replaces
+    a player picked at random. A generation is population_size steps.
+    population gives the starting number of players of each strategy
+    (as even as possible by default). runs independent populations are
+    simulated side by side as rows of one array, which is how the steps
+    stay vectorized. Returns an array of the shares of each run after
+    each generation, (generations + 1) x runs x strategies.
+    '''
+    payoffs = np.asarray(payoffs, dtype=float)
+    strategies = len(payoffs)
+    offset = _fitness_offset(payoffs, background)
+    if population is None:
+        population = [population_size // strategies +
+                      (strategy < population_size % strategies)
+                      for strategy in range(strategies)]
+    counts = np.tile(np.asarray(population, dtype=np.int64), (runs, 1))
+    population_size = int(counts[0].sum())
+    if population_size < 2:
+        raise ValueError('a Moran process needs at least 2 players')
+    rng = np.random.default_rng(random.Random(seed).getrandbits(64)
+                                if seed is not None else None)
+    by_opponent = payoffs.T.copy()
+    # each player's total payoff against the rest of the population, which
+    # is updated as the counts change rather than recomputed
+    totals = counts @ by_opponent - np.diag(payoffs)
+    run_rows = np.arange(runs)
+    history = np.empty((generations + 1, runs, strategies))
+    history[0] = counts / population_size
+    for generation in range(1, generations + 1):
+        if (counts.max(axis=1) == population_size).all():
+            # every run has fixated, so nothing can change any more
+            history[generation:] = counts / population_size
+            break
+        for step in range(population_size):
+            fitness = totals / (population_size - 1) + offset
+            births = _pick(rng, counts * fitness)
+            deaths = _pick(rng, counts)
+            counts[run_rows, births] += 1
+            counts[run_rows, deaths] -= 1
+            totals += by_opponent[births] - by_opponent[deaths]
+        history[generation] = counts / population_size
+    return history
+
+def _pick(rng, weights):
+    # one index per row of weights, picked in proportion to the weights
+    cumulative = weights.cumsum(axis=1)
+    targets = rng.random(len(weights)) * cumulative[:, -1]
+    picked = (cumulative <= targets[:, None]).sum(axis=1)
+    return np.minimum(picked, weights.shape[1] - 1)
+
+def play_evolution(num_players, generations=1000, mode='replicator',
+                   population_size=100, runs=1, seed=None, workers=1,
+                   engine='python', cache=None):
+    '''
+    Evolves a population of the teams and reports how it ends up on screen.
+    mode is 'replicator' (see replicator_dynamics()) or 'moran' (see
+    moran_process(), with population_size players and runs populations).
+    The matches behind the payoffs are played once, by payoff_matrix().
+    Returns (field, history), history being the shares each generation.
+    '''
+    if mode not in ('replicator', 'moran'):
+        raise ValueError('unknown mode %r' % (mode,))
+    field, payoffs = payoff_matrix(num_players, workers, seed=seed,
+                                   engine=engine, cache=cache)
+    if mode == 'replicator':
+        history = replicator_dynamics(payoffs, generations)
+        final = history[-1]
+        alive = history > 1e-6
+    else:
+        history = moran_process(payoffs, generations, population_size,
+                                runs=runs, seed=seed)
+        final = history[-1].mean(axis=0)
+        alive = (history > 0).any(axis=1)
+        fixated = (history[-1] == 1).sum(axis=0)
+    # the last generation each strategy still had players
+    last_alive = alive.shape[0] - 1 - alive[::-1].argmax(axis=0)
+
+    print('\n\n\tShare of the population after %d generations (%s):\n\n'
+          % (generations, mode))
+    for index in np.argsort(-final, kind='stable'):
+        line = 'player %s :  %6.2f%%' % (field[index], final[index] * 100)
+        if not alive[-1, index]:
+            line += '  died out after generation %d' % last_alive[index]
+        if mode == 'moran' and runs > 1:
+            line += '  took over %d of %d runs' % (fixated[index], runs)
+        print(line + '  ' + lookup_strategy(field[index]).team_name)
+    return field, history
+
+def _player_key(text):
+    # a player id on the command line, or else a strategy name
+    return int(text) if text.isdigit() else text
+
+def _number(text):
+    # payoffs stay whole numbers unless they need not be
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def _log_moves(text):
+    if text == 'all':
+        return True
+    if text == 'none':
+        return False
+    return float(text)
+
+def command_line_parser():
+    '''The argparse parser for main()'s command line. Every option's dest
+    is also the name of that setting in a --config file.'''
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Plays an iterative prisoner's dilemma tournament.",
+        epilog='Without any arguments it asks how many teams to play, '
+               'like it always has.')
+    choice = parser.add_argument_group('field')
+    choice.add_argument('--field', nargs='+', type=_player_key, metavar='PLAYER',
+                        help='player ids and plugin strategy names to play '
+                             '(default every strategy)')
+    choice.add_argument('--teams', type=int,
+                        help='play the first TEAMS strategies instead')
+    play = parser.add_argument_group('play')
+    play.add_argument('--seed', type=int,
+                      help='makes the whole run reproducible')
+    play.add_argument('--rounds', nargs=2, type=int, metavar=('MIN', 'MAX'),
+                      default=[MIN_ROUNDS, MAX_ROUNDS],
+                      help='range of every match\'s length (default %d %d)'
+                           % (MIN_ROUNDS, MAX_ROUNDS))
+    play.add_argument('--engine', choices=ENGINES, default='python')
+    play.add_argument('--workers', type=int, default=1,
+                      help='worker processes, 0 for one per CPU (default 1)')
+    play.add_argument('--payoffs', nargs=4, type=_number, metavar=('R', 'T', 'S', 'P'),
+                      help='release, treat, severe punishment and punishment')
+    play.add_argument('--mistake-rate', type=float, default=0.0,
+                      help='chance each move comes out the opposite way')
+    play.add_argument('--observation-rate', type=float, default=0.0,
+                      help='chance each move is seen the opposite way')
+    play.add_argument('--move-budget', type=float,
+                      help='CPU seconds a strategy gets for one decision')
+    play.add_argument('--match-budget', type=float,
+                      help='CPU seconds a strategy gets for one pairing')
+    play.add_argument('--cache', metavar='FILE',
+                      help='PairingCache to reuse pairing results from')
+    repeat = parser.add_argument_group('repetitions')
+    repeat.add_argument('--repetitions', type=int, default=1,
+                        help='play up to this many tournaments and report '
+                             'the means (default 1)')
+    repeat.add_argument('--min-repetitions', type=int, default=10)
+    repeat.add_argument('--confidence', type=float, default=0.95)
+    repeat.add_argument('--tolerance', type=float, default=1.0)
+    output = parser.add_argument_group('output')
+    output.add_argument('--output', default='tournament.txt', metavar='FILE',
+                        help='the text report (default tournament.txt)')
+    output.add_argument('--no-report', action='store_true',
+                        help="don't write the text report")
+    output.add_argument('--log-moves', type=_log_moves, default=True,
+                        metavar='all|none|FRACTION',
+                        help='which pairings\' moves go in the report')
+    output.add_argument('--match-log', metavar='FILE',
+                        help='also write a binary match log')
+    output.add_argument('--export', action='append', default=[], metavar='FILE',
+                        help='also write the results in columns to a .csv or '
+                             '.npz file (repeatable)')
+    output.add_argument('--sources', default=SOURCE_DIRECTORY, metavar='DIR',
+                        help='the source store the report refers to for the '
+                             'code that was played (default %(default)s)')
+    output.add_argument('--profile', action='store_true',
+                        help="time every strategy's decisions")
+    long_runs = parser.add_argument_group('long runs')
+    long_runs.add_argument('--journal', metavar='FILE',
+                           help='record finished pairings here as they finish')
+    long_runs.add_argument('--resume', action='store_true',
+                           help='carry on with the tournament in --journal')
+    long_runs.add_argument('--shards', type=int, default=1,
+                           help='play the tournament as this many shards, '
+                                '--workers at a time')
+    long_runs.add_argument('--shard-dir', default='shards', metavar='DIR',
+                           help='where the shard files go (default shards)')
+    parser.add_argument('--config', metavar='FILE',
+                        help='JSON file of tournament configurations to run '
+                             'one after another (see run_configurations())')
+    return parser
+
+# settings that repeated and sharded tournaments have no use for; giving
+# them is an error rather than having them quietly ignored (repeated
+# tournaments never write a report, so --no-report is fine there)
+_NOT_REPEATED = ('mistake_rate', 'observation_rate', 'move_budget',
+                 'match_budget', 'cache', 'profile', 'output', 'log_moves',
+                 'match_log', 'export', 'journal', 'resume', 'shards',
+                 'shard_dir', 'sources')
+_NOT_SHARDED = ('cache', 'journal', 'resume')
+
+def _check_unused(settings, names, kind):
+    # raises ValueError naming any of the settings that isn't its default
+    defaults = vars(command_line_parser().parse_args([]))
+    given = ['--' + name.replace('_', '-') for name in names
+             if settings.get(name, defaults[name]) != defaults[name]]
+    if given:
+        raise ValueError('%s tournaments can\'t use %s' % (kind, ', '.join(given)))
+
+def run_configuration(settings, caches=None):
+    '''
+    Plays the tournament described by settings, a dict of
+    command_line_parser() settings by dest, with play_tournament(),
+    play_sharded_tournament() or, for more than one repetition,
+    play_repeated_tournaments(), and returns what it returned.
+    caches is {filename: PairingCache} of caches already open, which
+    the run uses (and adds its own to) instead of reopening them.
+    Raises ValueError for settings the kind of run can't use.
+    '''
+    if settings['repetitions'] > 1:
+        _check_unused(settings, _NOT_REPEATED, 'repeated')
+    elif settings['shards'] > 1:
+        _check_unused(settings, _NOT_SHARDED, 'sharded')
+    if settings.get('field'):
+        field = load_field(settings['field'])
+    else:
+        field = available_strategies()
+        if settings.get('teams'):
+            field = field[:settings['teams']]
+    workers = settings['workers'] or None
+    payoffs = Payoffs(*settings['payoffs']) if settings.get('payoffs') else _payoffs
+    noise = Noise(settings['mistake_rate'], settings['observation_rate'])
+    datafile = None if settings['no_report'] else os.path.abspath(settings['output'])
+    cache = settings.get('cache')
+    if cache is not None and caches is not None:
+        if cache not in caches:
+            caches[cache] = PairingCache(cache)
+        cache = caches[cache]
+    with match_lengths(*settings['rounds']):
+        if settings['repetitions'] > 1:
+            with scoring(payoffs):
+                return play_repeated_tournaments(
+                    field, settings['repetitions'], settings['min_repetitions'],
+                    settings['confidence'], settings['tolerance'], workers,
+                    settings['seed'], settings['engine'])
+        played = dict(seed=settings['seed'], engine=settings['engine'],
+                      sources=settings['sources'],
+                      profile=settings['profile'],
+                      move_budget=settings['move_budget'],
+                      match_budget=settings['match_budget'],
+                      noise=noise if noise else None, payoffs=payoffs)
+        if settings['shards'] > 1:
+            return play_sharded_tournament(
+                field, settings['shards'], settings['shard_dir'], workers,
+                settings['log_moves'], settings['match_log'], datafile,
+                settings['export'], **played)
+        return play_tournament(
+            field, workers, cache=cache, log_moves=settings['log_moves'],
+            match_log=settings['match_log'], datafile=datafile,
+            journal=settings['journal'], resume=settings['resume'],
+            export=settings['export'], **played)
+
+# settings that can name files after the rest of their run's settings
+_FILE_SETTINGS = ('output', 'match_log', 'journal', 'shard_dir', 'cache',
+                  'export', 'sources')
+
+def run_configurations(filename, defaults):
+    '''
+    Runs every tournament configuration in a JSON config file, one after
+    another in this process, so the strategies are only loaded once and
+    every run shares the open PairingCaches. The file is an object with
+    any of
+      "settings": settings for every run,
+      "matrix": {setting: [values]}, to run every combination of values,
+      "runs": [settings, ...], to run each of these (times the matrix),
+    where settings are named by command_line_parser() dest, like
+    {"teams": 21, "log_moves": false}, and go on top of defaults, the
+    command line's. File names can use the run's settings, as in
+    "output": "tournament-{engine}-{seed}.txt".
+    '''
+    import itertools
+    import json
+    with open(filename) as config_file:
+        config = json.load(config_file)
+    unknown = set(config) - set(('settings', 'matrix', 'runs'))
+    if unknown:
+        raise ValueError('unknown sections %s in %s' % (sorted(unknown), filename))
+    matrix = sorted(config.get('matrix', {}).items())
+    names = [name for name, values in matrix]
+    runs = []
+    for run in config.get('runs', [{}]):
+        for values in itertools.product(*[values for name, values in matrix]):
+            settings = dict(defaults)
+            settings.update(config.get('settings', {}))
+            settings.update(run)
+            settings.update(zip(names, values))
+            unknown = set(settings) - set(defaults)
+            if unknown:
+                raise ValueError('unknown settings %s in %s'
+                                 % (sorted(unknown), filename))
+            for name in _FILE_SETTINGS:
+                if isinstance(settings[name], str):
+                    settings[name] = settings[name].format(**settings)
+                elif isinstance(settings[name], list):
+                    settings[name] = [value.format(**settings)
+                                      for value in settings[name]]
+            runs.append(settings)
+    caches = {}
+    try:
+        for number, settings in enumerate(runs):
+            print('\n\n=== run %d of %d: %s' % (
+                number + 1, len(runs), ', '.join(
+                    '%s=%s' % (name, settings[name]) for name in sorted(settings)
+                    if settings[name] != defaults[name])))
+            run_configuration(settings, caches)
+    finally:
+        for cache in caches.values():
+            cache.close()
+
+def main(argv=None):
+    if argv is None:
+        import sys
+        argv = sys.argv[1:]
+    if argv:
+        parser = command_line_parser()
+        args = parser.parse_args(argv)
+        if args.resume and not args.journal:
+            parser.error('--resume needs the --journal to resume')
+        settings = vars(args)
+        config = settings.pop('config')
+        try:
+            if config is not None:
+                run_configurations(config, settings)
+            else:
+                run_configuration(settings)
+        except (KeyError, ValueError) as error:
+            parser.error(str(error))
+        return
+    # the built-in teams first, then any plugins, none of them imported yet
+    available = available_strategies()
+    howmanyteams=int(input("How many teams do you want to run in this tournament? Max:%d  "
+                           % (len(available) - 1)))
     howmanyteams+=1
-    if howmanyteams>21:
-        play_tournament(21)
+    if howmanyteams>len(available):
+        play_tournament(available)
     else:
-        play_tournament(howmanyteams)
+        play_tournament(available[:howmanyteams])
 
 if __name__=="__main__":
     main()
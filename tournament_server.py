@@ -0,0 +1,464 @@
+'''
+A tournament server for running a league of prisoners_dilemma.py
+tournaments: a small HTTP/JSON API on asyncio that takes strategy
+submissions, queues tournaments, plays them on a pool of worker processes
+and streams every pairing's result to clients as it finishes.
+
+  GET  /strategies                   every registered strategy
+  POST /strategies                   submit one: {"name", "source"}, where
+                                     source defines get_action() like a
+                                     plugin in the strategies directory
+  GET  /tournaments                  every tournament and its status
+  POST /tournaments                  queue one: {"field" of registered
+                                     ids and names, and optionally
+                                     "seed", "engine", "mistake_rate",
+                                     "observation_rate", "payoffs"}
+  GET  /tournaments/<id>             its status, and its tables once done
+  GET  /tournaments/<id>/events      server-sent events: one "pairing"
+                                     event per finished pairing, then
+                                     "done" (or "failed")
+
+Submitted strategies only ever run in other processes: each submission
+is loaded and checked in a process of its own, which is killed if it
+takes longer than the match budget, and is then played in the worker
+processes under a Sandbox, so one that loops forever only costs its time
+budget. Still, the server runs whatever code is submitted, so it listens
+on localhost unless told otherwise.
+For example:
+
+  python tournament_server.py --port 8765 --workers 4
+  curl -d '{"field": [0, 1, 2, 3], "seed": 1}' localhost:8765/tournaments
+  curl localhost:8765/tournaments/1/events
+'''
+
+import argparse
+import ast
+import asyncio
+import functools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import prisoners_dilemma as pd
+
+# the most a request body can be, which is plenty for a strategy's source
+MAX_BODY = 1 << 20
+
+STATUS_TEXT = {200: 'OK', 201: 'Created', 202: 'Accepted',
+               400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large',
+               500: 'Internal Server Error'}
+
+class RequestError(Exception):
+    '''An error to send back to the client as (status, message).'''
+
+def _unloaded(history, opponent_history, score, opponent_score):
+    # stands in for a submitted strategy in the server process, which
+    # never imports or runs submitted code itself
+    raise RuntimeError('submitted strategies only run in worker processes')
+
+def _check_strategy(name, directory):
+    # runs in a process of its own (see TournamentServer.check_strategy()):
+    # loads the strategy, which runs its module and, for MEMORY, its
+    # get_action(), and reports its team name as the last line of output
+    player = pd.load_strategy(name, directory)
+    print(json.dumps({'team_name': pd.lookup_strategy(player).team_name}))
+
+def _play_batch(plugins, payoffs, pairings, seed, engine, noise, move_budget,
+                match_budget):
+    # runs in a worker process, which may have started before some of the
+    # strategies were submitted, so it loads any plugins it is missing;
+    # a worker forked from the server inherits its stand-ins, which have
+    # to make way for the real strategies
+    for name, directory, player in plugins:
+        strategy = pd.STRATEGIES.get(player)
+        if strategy is not None and strategy.function is _unloaded:
+            del pd.STRATEGIES[player]
+    pd.load_plugins(plugins)
+    sandbox = pd.Sandbox(move_budget, match_budget)
+    with pd.scoring(payoffs), pd.sandboxed(sandbox):
+        results = list(pd.play_field_pairings(pairings, seed=seed,
+                                              engine=engine, noise=noise,
+                                              summarize=True))
+    return results, sandbox.snapshot()
+
+class Tournament(object):
+    '''
+    One queued tournament: its settings, the events sent so far (kept so
+    clients that connect late see the whole tournament) and its tables
+    once it is done.
+    '''
+    def __init__(self, number, field, seed=None, engine='python', noise=None,
+                 payoffs=None):
+        self.number = number
+        self.field = field
+        self.seed = seed
+        self.engine = engine
+        self.noise = noise
+        self.payoffs = payoffs if payoffs is not None else pd.DEFAULT_PAYOFFS
+        self.team_names = [pd.lookup_strategy(player).team_name
+                           for player in field]
+        self.status = 'queued'
+        self.played = 0
+        self.pairings = len(field) * (len(field) - 1) // 2
+        self.events = []
+        self.changed = asyncio.Event()
+        self.result = None
+
+    def publish(self, kind, data):
+        self.events.append((kind, data))
+        # wake up every stream waiting on this tournament
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def describe(self):
+        description = {'id': self.number, 'status': self.status,
+                       'field': self.field, 'team_names': self.team_names,
+                       'seed': self.seed, 'engine': self.engine,
+                       'pairings': self.pairings, 'played': self.played}
+        if self.result is not None:
+            description.update(self.result)
+        return description
+
+class TournamentServer(object):
+    '''
+    Queues tournaments and plays at most concurrent of them at a time on
+    one shared pool of workers processes, each tournament's pairings
+    being handed out in batches so results stream back as they finish.
+    Strategies are submitted as plugins into directory; the server only
+    registers a stand-in for each, with the team name found by
+    check_strategy(), and the workers load the real ones.
+    '''
+    def __init__(self, workers=None, concurrent=2, directory=None,
+                 move_budget=1.0, match_budget=10.0, batch_size=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.directory = directory if directory is not None else pd.STRATEGY_DIRECTORY
+        self.move_budget = move_budget
+        self.match_budget = match_budget
+        self.batch_size = batch_size
+        self.tournaments = {}
+        # (name, directory, player) of every submitted strategy
+        self._submitted = []
+        # names of submissions that are still being checked
+        self._pending = set()
+        self._slots = asyncio.Semaphore(concurrent)
+        self._pool = None
+
+    def start(self):
+        # the workers reseed their random state, like a tournament's do
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=pd._init_worker,
+            initargs=(False, None, pd.loaded_plugins(), pd._payoffs,
+                      pd._match_lengths))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+    # strategies
+
+    def list_strategies(self):
+        return [{'id': player, 'name': strategy.name,
+                 'team_name': strategy.team_name}
+                for player, strategy in sorted(pd.STRATEGIES.items())]
+
+    async def check_strategy(self, name):
+        '''
+        Loads the strategy name from the directory in a new process, killed
+        after match_budget seconds, and returns its team name. Raises
+        RequestError if it didn't load in time or at all.
+        '''
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), '--check-strategy', name,
+            '--strategies', self.directory,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            output, errors = await asyncio.wait_for(process.communicate(),
+                                                    self.match_budget)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise RequestError(400, 'loading the strategy took over %gs'
+                               % self.match_budget)
+        if process.returncode != 0:
+            lines = errors.decode('utf-8', 'replace').strip().splitlines()
+            raise RequestError(400, 'loading the strategy failed: %s'
+                               % (lines[-1] if lines else process.returncode))
+        try:
+            team_name = json.loads(output.decode('utf-8').splitlines()[-1])['team_name']
+        except (ValueError, IndexError, KeyError, TypeError):
+            team_name = None
+        if not isinstance(team_name, str):
+            raise RequestError(400, 'TEAM_NAME must be a string')
+        return team_name
+
+    async def submit_strategy(self, request):
+        name = request.get('name')
+        source = request.get('source')
+        if not isinstance(name, str) or not name.isidentifier() or \
+                name.startswith('_'):
+            raise RequestError(400, 'name must be a python identifier')
+        if not isinstance(source, str):
+            raise RequestError(400, 'source must be the strategy module source')
+        if name in pd.STRATEGY_NAMES or name in self._pending or \
+                name in pd.discover_strategies(self.directory):
+            raise RequestError(400, 'there already is a strategy named %r' % name)
+        try:
+            tree = ast.parse(source)
+        except SyntaxError as error:
+            raise RequestError(400, 'source does not compile: %s' % error)
+        if not any(isinstance(node, ast.FunctionDef) and node.name == 'get_action'
+                   for node in tree.body):
+            raise RequestError(400, 'source must define get_action()')
+        os.makedirs(self.directory, exist_ok=True)
+        filename = os.path.join(self.directory, name + '.py')
+        # the name is taken from here on, though nothing can play it until
+        # it has been checked and registered
+        self._pending.add(name)
+        try:
+            with open(filename, 'x') as module:
+                module.write(source)
+            try:
+                team_name = await self.check_strategy(name)
+            except RequestError:
+                os.remove(filename)
+                raise
+        finally:
+            self._pending.discard(name)
+        player = max(pd.STRATEGIES) + 1
+        pd.register_strategy(player, team_name, name=name)(_unloaded)
+        self._submitted.append((name, self.directory, player))
+        return {'id': player, 'name': name, 'team_name': team_name}
+
+    # tournaments
+
+    def queue_tournament(self, request):
+        try:
+            # only strategies that are registered already, never loading
+            # anything here: submissions only run in other processes
+            field = request['field']
+            if not isinstance(field, list):
+                raise TypeError('field must be a list of ids and names')
+            field = [pd.lookup_strategy(key).player for key in field]
+            if len(set(field)) != len(field):
+                raise ValueError('a strategy can only be in the field once')
+            engine = request.get('engine', 'python')
+            if engine not in pd.ENGINES:
+                raise ValueError('unknown engine %r' % (engine,))
+            noise = pd.Noise(request.get('mistake_rate', 0.0),
+                             request.get('observation_rate', 0.0))
+            payoffs = request.get('payoffs')
+            if payoffs is not None:
+                payoffs = pd.Payoffs(*payoffs)
+        except (KeyError, TypeError, ValueError) as error:
+            raise RequestError(400, 'bad tournament: %s' % (error,))
+        if len(field) < 2:
+            raise RequestError(400, 'a tournament needs at least 2 teams')
+        number = len(self.tournaments) + 1
+        tournament = Tournament(number, field, request.get('seed'), engine,
+                                noise if noise else None, payoffs)
+        self.tournaments[number] = tournament
+        asyncio.get_event_loop().create_task(self._run(tournament))
+        return tournament.describe()
+
+    async def _run(self, tournament):
+        async with self._slots:
+            tournament.status = 'running'
+            try:
+                await self._play(tournament)
+            except Exception as error:
+                tournament.status = 'failed'
+                tournament.publish('failed', {'error': repr(error)})
+            else:
+                tournament.status = 'done'
+                tournament.publish('done', tournament.result)
+
+    async def _play(self, tournament):
+        loop = asyncio.get_event_loop()
+        field = tournament.field
+        position = dict((player, index) for index, player in enumerate(field))
+        pairings = [(field[player1], field[player2])
+                    for player1 in range(len(field)) for player2 in range(player1)]
+        batch_size = self.batch_size or max(1, len(pairings) // (self.workers * 4))
+        play = functools.partial(_play_batch,
+                                 pd.loaded_plugins() + self._submitted,
+                                 tournament.payoffs, seed=tournament.seed,
+                                 engine=tournament.engine,
+                                 noise=tournament.noise,
+                                 move_budget=self.move_budget,
+                                 match_budget=self.match_budget)
+        batches = [loop.run_in_executor(self._pool, play,
+                                        pairings[start:start + batch_size])
+                   for start in range(0, len(pairings), batch_size)]
+        result_table = pd.ResultMatrix(len(field))
+        violations = pd.Sandbox(self.move_budget, self.match_budget)
+        for batch in asyncio.as_completed(batches):
+            results, snapshot = await batch
+            violations.merge(snapshot)
+            for player1, player2, score1, score2, rounds, summary in results:
+                score1, score2 = pd.scores_per_round(score1, score2, rounds)
+                result_table[position[player1]][position[player2]] = score1
+                result_table[position[player2]][position[player1]] = score2
+                tournament.played += 1
+                event = {'player1': player1, 'player2': player2,
+                         'score1_per_round': score1,
+                         'score2_per_round': score2, 'rounds': rounds}
+                if summary is not None:
+                    event.update((name, getattr(summary, name))
+                                 for name in summary.__slots__)
+                tournament.publish('pairing', event)
+        # a row's sum is a team's score, as in play_tournament()
+        scores = [sum(result_table[player][opponent]
+                      for opponent in range(len(field)))
+                  for player in range(len(field))]
+        tournament.result = {
+            'result_table': result_table.tolist(),
+            'scores': scores,
+            'average_per_round': [score / len(field) for score in scores],
+            'violations': violations.report_lines(
+                dict(zip(field, tournament.team_names)))}
+
+    # HTTP
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, path, body = await self._read_request(reader)
+                await self._route(method, path, body, writer)
+            except RequestError as error:
+                status, message = error.args
+                await self._send_json(writer, status, {'error': message})
+            except Exception as error:
+                # never leave a client without an answer
+                await self._send_json(writer, 500, {'error': repr(error)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise RequestError(400, 'bad request line')
+        method, path = request_line[0], request_line[1].split('?')[0]
+        length = 0
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            header, _, value = line.partition(':')
+            if header.strip().lower() == 'content-length':
+                try:
+                    length = int(value)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    raise RequestError(400, 'bad Content-Length %r' % value.strip())
+        if length > MAX_BODY:
+            raise RequestError(413, 'request body too large')
+        body = None
+        if length:
+            try:
+                body = json.loads((await reader.readexactly(length)).decode('utf-8'))
+            except ValueError:
+                raise RequestError(400, 'the body must be JSON')
+            if not isinstance(body, dict):
+                raise RequestError(400, 'the body must be a JSON object')
+        return method, path, body
+
+    async def _route(self, method, path, body, writer):
+        parts = [part for part in path.split('/') if part]
+        if parts == ['strategies']:
+            if method == 'GET':
+                return await self._send_json(writer, 200, self.list_strategies())
+            if method == 'POST':
+                return await self._send_json(
+                    writer, 201, await self.submit_strategy(body or {}))
+        elif parts == ['tournaments']:
+            if method == 'GET':
+                return await self._send_json(
+                    writer, 200, [tournament.describe() for tournament
+                                  in self.tournaments.values()])
+            if method == 'POST':
+                return await self._send_json(writer, 202,
+                                             self.queue_tournament(body or {}))
+        elif len(parts) in (2, 3) and parts[0] == 'tournaments':
+            try:
+                tournament = self.tournaments[int(parts[1])]
+            except (ValueError, KeyError):
+                raise RequestError(404, 'no such tournament')
+            if len(parts) == 2 and method == 'GET':
+                return await self._send_json(writer, 200, tournament.describe())
+            if parts[2:] == ['events'] and method == 'GET':
+                return await self._stream_events(tournament, writer)
+        else:
+            raise RequestError(404, 'nothing at %s' % path)
+        raise RequestError(405, '%s is not allowed on %s' % (method, path))
+
+    async def _send_json(self, writer, status, data):
+        body = json.dumps(data).encode('utf-8')
+        writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+                      'Content-Length: %d\r\nConnection: close\r\n\r\n'
+                      % (status, STATUS_TEXT[status], len(body))).encode('latin-1'))
+        writer.write(body)
+        await writer.drain()
+
+    async def _stream_events(self, tournament, writer):
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\nConnection: close\r\n\r\n')
+        sent = 0
+        while True:
+            changed = tournament.changed
+            for kind, data in tournament.events[sent:]:
+                writer.write(('event: %s\ndata: %s\n\n'
+                              % (kind, json.dumps(data))).encode('utf-8'))
+            sent = len(tournament.events)
+            await writer.drain()
+            if tournament.status in ('done', 'failed') and \
+                    sent == len(tournament.events):
+                return
+            await changed.wait()
+
+async def serve(host='127.0.0.1', port=8765, **settings):
+    '''Runs a TournamentServer until cancelled; settings are passed on to it.'''
+    server = TournamentServer(**settings)
+    server.start()
+    try:
+        listener = await asyncio.start_server(server.handle, host, port)
+        print('serving tournaments on http://%s:%d' % (host, port))
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default one per CPU)')
+    parser.add_argument('--concurrent', type=int, default=2,
+                        help='tournaments played at the same time')
+    parser.add_argument('--strategies', default=None,
+                        help='directory submitted strategies are saved in')
+    parser.add_argument('--move-budget', type=float, default=1.0,
+                        help='CPU seconds a strategy gets for one move')
+    parser.add_argument('--match-budget', type=float, default=10.0,
+                        help='CPU seconds a strategy gets for one pairing')
+    # how the server checks a submission, in a process of its own
+    parser.add_argument('--check-strategy', metavar='NAME', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.check_strategy is not None:
+        _check_strategy(args.check_strategy, args.strategies)
+        return
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers,
+                          concurrent=args.concurrent, directory=args.strategies,
+                          move_budget=args.move_budget,
+                          match_budget=args.match_budget))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()